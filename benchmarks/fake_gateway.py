@@ -0,0 +1,142 @@
+"""
+In-process stand-in for a TeleICU gateway, used by the benchmarks to
+exercise the plugin without any network access.
+"""
+
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+KEY_ID = "fake-gateway"
+
+
+class FakeGatewayState:
+    def __init__(self, latency=0.0, failure_rate=0.0, payload_size=0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.payload_size = payload_size
+        self.request_count = 0
+        self.lock = threading.Lock()
+        self.private_key = rsa.generate_private_key(
+            public_exponent=65537, key_size=2048
+        )
+        jwk = json.loads(
+            jwt.algorithms.RSAAlgorithm.to_jwk(self.private_key.public_key())
+        )
+        jwk.update({"kid": KEY_ID, "use": "sig", "alg": "RS256"})
+        self.jwks = {"keys": [jwk]}
+
+    def sign_token(self, exp=300, **claims):
+        issued_at = int(time.time())
+        return jwt.encode(
+            {"iat": issued_at, "exp": issued_at + exp, **claims},
+            self.private_key,
+            algorithm="RS256",
+            headers={"kid": KEY_ID},
+        )
+
+
+class FakeGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: "FakeGatewayServer"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_body(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send_json(self, payload, status=200):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self):
+        state = self.server.state
+        self._read_body()
+        with state.lock:
+            state.request_count += 1
+
+        path = urlparse(self.path).path
+        if path == "/openid-configuration/":
+            return self._send_json(state.jwks)
+
+        if state.latency:
+            time.sleep(state.latency)
+        if state.failure_rate and random.random() < state.failure_rate:
+            return self._send_json({"error": "injected failure"}, status=500)
+
+        padding = "x" * state.payload_size
+        if path == "/status":
+            return self._send_json(
+                {
+                    "position": {"x": 0.0, "y": 0.0, "zoom": 0.0},
+                    "moveStatus": {"panTilt": "IDLE", "zoom": "IDLE"},
+                    "error": "NO error",
+                    "padding": padding,
+                }
+            )
+        if path == "/presets":
+            presets = {f"preset_{i}": i for i in range(10)}
+            return self._send_json({**presets, "_": padding})
+        if path in ("/gotoPreset", "/absoluteMove", "/relativeMove"):
+            return self._send_json({"status": "success"})
+        if path == "/getToken/videoFeed":
+            return self._send_json({"token": state.sign_token(exp=3600)})
+        return self._send_json({"error": "not found"}, status=404)
+
+    do_GET = _handle
+    do_POST = _handle
+
+
+class FakeGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, state: FakeGatewayState, host="127.0.0.1", port=0):
+        super().__init__((host, port), FakeGatewayHandler)
+        self.state = state
+
+    @property
+    def endpoint_address(self) -> str:
+        host, port = self.server_address[:2]
+        return f"{host}:{port}"
+
+
+class FakeGateway:
+    """
+    Runs a `FakeGatewayServer` in a background thread for the duration of a
+    `with` block.
+
+        with FakeGateway(latency=0.01) as gateway:
+            requests.get(f"http://{gateway.endpoint_address}/status")
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, payload_size=0):
+        self.state = FakeGatewayState(latency, failure_rate, payload_size)
+        self.server = None
+        self.thread = None
+
+    @property
+    def endpoint_address(self) -> str:
+        return self.server.endpoint_address
+
+    def __enter__(self):
+        self.server = FakeGatewayServer(self.state)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
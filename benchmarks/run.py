@@ -0,0 +1,110 @@
+"""
+Runs the plugin benchmarks against an in-process fake gateway and a test
+database, and writes the results as JSON.
+
+Run from the care root with the plugins installed, eg.
+
+    DJANGO_SETTINGS_MODULE=config.settings.test \
+        python /path/to/care_teleicu_devices/benchmarks/run.py --output bench.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def get_commit() -> str | None:
+    try:
+        return (
+            subprocess.check_output(
+                ["git", "rev-parse", "HEAD"], cwd=REPO_ROOT, stderr=subprocess.DEVNULL
+            )
+            .decode()
+            .strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--output", help="file to write the JSON results to")
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="fake gateway latency in seconds"
+    )
+    parser.add_argument(
+        "--failure-rate",
+        type=float,
+        default=0.0,
+        help="fraction of fake gateway calls that fail with a 500",
+    )
+    parser.add_argument(
+        "--only", nargs="*", help="names of the benchmark suites to run"
+    )
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    sys.path[:0] = [os.getcwd(), str(REPO_ROOT)]
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.test")
+
+    import django
+
+    django.setup()
+
+    from django.test.utils import (
+        setup_databases,
+        setup_test_environment,
+        teardown_databases,
+        teardown_test_environment,
+    )
+
+    from benchmarks.fake_gateway import FakeGateway
+    from benchmarks.suites import SUITES
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    results = []
+    try:
+        with FakeGateway(
+            latency=args.latency, failure_rate=args.failure_rate
+        ) as gateway:
+            for name, suite in SUITES.items():
+                if args.only and name not in args.only:
+                    continue
+                results.extend(suite(gateway, args.iterations))
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        teardown_test_environment()
+
+    output = json.dumps(
+        {
+            "commit": get_commit(),
+            "timestamp": time.time(),
+            "python": platform.python_version(),
+            "config": {
+                "iterations": args.iterations,
+                "latency": args.latency,
+                "failure_rate": args.failure_rate,
+            },
+            "results": results,
+        },
+        indent=2,
+    )
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
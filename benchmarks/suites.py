@@ -0,0 +1,469 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import NoReverseMatch, reverse
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework.exceptions import APIException
+from rest_framework.test import APIClient, APIRequestFactory
+
+from camera_device.apps import PLUGIN_NAME as CAMERA_PLUGIN_NAME
+from camera_device.models import PositionPreset
+from care.emr.models import Device, Encounter, FacilityLocation
+from care.users.models import User
+from gateway_device.async_client import AsyncGatewayClient
+from gateway_device.auth_cache import public_key_cache, verified_token_cache
+from gateway_device.authentication import GatewayAuthentication
+from gateway_device.client import GatewayClient
+from vitals_observation_device.ingestion import (
+    build_observation,
+    build_observations_batch,
+)
+
+CONCURRENCY = 16
+RECORD_BATCH_SIZES = (1, 10, 100, 500)
+PRESET_COUNT = 50
+
+
+def summarize(name, timings, items_per_call=1, wall_time=None, failures=0, **params):
+    total = wall_time if wall_time is not None else sum(timings)
+    ordered = sorted(timings)
+    # only the calls that succeeded count towards the throughput
+    succeeded = len(timings) - failures
+    return {
+        "name": name,
+        "params": params,
+        "calls": len(timings),
+        "failures": failures,
+        "calls_per_sec": succeeded / total if total else None,
+        "items_per_sec": succeeded * items_per_call / total if total else None,
+        "mean_ms": statistics.fmean(timings) * 1000,
+        "p50_ms": ordered[len(ordered) // 2] * 1000,
+        "p95_ms": ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000,
+    }
+
+
+def is_success(result):
+    if isinstance(result, list | tuple):
+        return all(is_success(item) for item in result)
+    status_code = getattr(result, "status_code", None)
+    return status_code is None or status_code < 400  # noqa: PLR2004
+
+
+def timed(func):
+    """
+    Returns the duration of the call and whether it succeeded, which it did
+    not if it raised an API exception (eg. an injected gateway failure) or
+    returned an error response.
+    """
+    started_at = time.perf_counter()
+    try:
+        succeeded = is_success(func())
+    except APIException:
+        succeeded = False
+    return time.perf_counter() - started_at, succeeded
+
+
+def summarize_calls(name, calls, **params):
+    return summarize(
+        name,
+        [duration for duration, _ in calls],
+        failures=sum(not succeeded for _, succeeded in calls),
+        **params,
+    )
+
+
+def measure(name, func, iterations, warmup=5, setup=None, **params):
+    for _ in range(warmup):
+        if setup:
+            setup()
+        timed(func)
+    calls = []
+    for _ in range(iterations):
+        if setup:
+            setup()
+        calls.append(timed(func))
+    return summarize_calls(name, calls, **params)
+
+
+def measure_concurrent(name, func, iterations, concurrency=CONCURRENCY, **params):
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started_at = time.perf_counter()
+        calls = list(executor.map(lambda _: timed(func), range(iterations)))
+        wall_time = time.perf_counter() - started_at
+    return summarize_calls(
+        name, calls, wall_time=wall_time, concurrency=concurrency, **params
+    )
+
+
+def resolve_url(name, fallback, **kwargs):
+    try:
+        return reverse(name, kwargs=kwargs)
+    except NoReverseMatch:
+        return fallback.format(**kwargs)
+
+
+def check_response(response):
+    if response.status_code >= 400:  # noqa: PLR2004
+        raise RuntimeError(
+            f"Benchmark request failed with {response.status_code}: "
+            f"{response.content[:500]!r}"
+        )
+    return response
+
+
+def make_gateway_device(gateway):
+    return baker.make(
+        Device,
+        care_type="gateway",
+        metadata={"endpoint_address": gateway.endpoint_address, "insecure": True},
+    )
+
+
+def gateway_headers(gateway, gateway_device):
+    return {
+        "HTTP_AUTHORIZATION": f"Gateway_Bearer {gateway.state.sign_token()}",
+        "HTTP_X_GATEWAY_ID": str(gateway_device.external_id),
+    }
+
+
+def gateway_client_suite(gateway, iterations):
+    gateway_device = SimpleNamespace(
+        metadata={"endpoint_address": gateway.endpoint_address, "insecure": True}
+    )
+    client = GatewayClient(gateway_device)
+    camera_data = {"hostname": "10.0.0.1", "port": 80, "username": "", "password": ""}
+    ptz_data = {**camera_data, "x": 0.1, "y": 0.1, "zoom": 0.0}
+
+    results = [
+        measure(
+            "gateway_client.get_status",
+            lambda: client.get("/status", camera_data),
+            iterations,
+        ),
+        measure(
+            "gateway_client.get_status_http_response",
+            lambda: client.get("/status", camera_data, as_http_response=True),
+            iterations,
+        ),
+        measure(
+            "gateway_client.relative_move",
+            lambda: client.post("/relativeMove", ptz_data),
+            iterations,
+        ),
+        measure_concurrent(
+            "gateway_client.get_status_concurrent",
+            lambda: client.get("/status", camera_data),
+            iterations,
+        ),
+    ]
+
+    async_client = AsyncGatewayClient(gateway_device)
+
+    async def run_async():
+        async def call():
+            started_at = time.perf_counter()
+            try:
+                await async_client.get("/status", camera_data)
+                succeeded = True
+            except APIException:
+                succeeded = False
+            return time.perf_counter() - started_at, succeeded
+
+        semaphore = asyncio.Semaphore(CONCURRENCY * 4)
+
+        async def bounded_call():
+            async with semaphore:
+                return await call()
+
+        started_at = time.perf_counter()
+        calls = await asyncio.gather(*(bounded_call() for _ in range(iterations)))
+        return calls, time.perf_counter() - started_at
+
+    calls, wall_time = asyncio.run(run_async())
+    results.append(
+        summarize_calls(
+            "async_gateway_client.get_status_concurrent",
+            calls,
+            wall_time=wall_time,
+            concurrency=CONCURRENCY * 4,
+        )
+    )
+    return results
+
+
+def gateway_authentication_suite(gateway, iterations):
+    gateway_device = make_gateway_device(gateway)
+    authentication = GatewayAuthentication()
+    request = APIRequestFactory().get("/", **gateway_headers(gateway, gateway_device))
+
+    def clear_caches():
+        cache.clear()
+        public_key_cache.clear()
+        verified_token_cache.clear()
+
+    return [
+        measure(
+            "gateway_authentication.cold",
+            lambda: authentication.authenticate(request),
+            iterations,
+            setup=clear_caches,
+        ),
+        measure(
+            "gateway_authentication.warm",
+            lambda: authentication.authenticate(request),
+            iterations,
+        ),
+    ]
+
+
+def observation_payload(count):
+    # distinct timestamps, so that readings are not dropped as duplicates
+    now = timezone.now()
+    return [
+        {
+            "status": "final",
+            "category": {
+                "system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                "code": "vital-signs",
+                "display": "Vital Signs",
+            },
+            "main_code": {
+                "system": "http://loinc.org",
+                "code": "8867-4",
+                "display": "Heart rate",
+            },
+            "value_type": "decimal",
+            "value": {"value": str(60 + i % 40)},
+            "effective_datetime": (now + timedelta(microseconds=i)).isoformat(),
+        }
+        for i in range(count)
+    ]
+
+
+MONITOR_VITALS = (
+    ("8867-4", "Heart rate"),
+    ("59408-5", "Oxygen saturation in Arterial blood by Pulse oximetry"),
+    ("9279-1", "Respiratory rate"),
+    ("8480-6", "Systolic blood pressure"),
+    ("8310-5", "Body temperature"),
+)
+
+
+def monitor_payload(count):
+    """
+    Readings of a monitor posting HR / SpO2 / RR / BP / temperature.
+    """
+    payload = observation_payload(count)
+    for i, observation in enumerate(payload):
+        code, display = MONITOR_VITALS[i % len(MONITOR_VITALS)]
+        observation["main_code"] = {
+            "system": "http://loinc.org",
+            "code": code,
+            "display": display,
+        }
+    return payload
+
+
+def record_ingestion_suite(gateway, iterations):
+    gateway_device = make_gateway_device(gateway)
+    encounter = baker.make(Encounter)
+    monitor = baker.make(
+        Device,
+        care_type="vitals-observation",
+        metadata={
+            "type": "HL7-Monitor",
+            "gateway": str(gateway_device.external_id),
+            "endpoint_address": "10.0.0.2",
+        },
+        current_encounter=encounter,
+    )
+    url = resolve_url(
+        "automated-observations-record",
+        "/api/vitals_observation_device/automated_observations/{external_id}/record/",
+        external_id=monitor.external_id,
+    )
+    client = APIClient()
+    client.credentials(**gateway_headers(gateway, gateway_device))
+
+    check_response(client.post(url, observation_payload(1), format="json"))
+
+    results = []
+    for batch_size in RECORD_BATCH_SIZES:
+        payload = []
+
+        def next_payload(batch_size=batch_size, payload=payload):
+            payload[:] = observation_payload(batch_size)
+
+        results.append(
+            measure(
+                "automated_observations.record",
+                lambda payload=payload: client.post(url, payload, format="json"),
+                max(5, iterations // batch_size),
+                setup=next_payload,
+                items_per_call=batch_size,
+                batch_size=batch_size,
+            )
+        )
+        repeated = observation_payload(batch_size)
+        check_response(client.post(url, repeated, format="json"))
+        results.append(
+            measure(
+                "automated_observations.record_duplicates",
+                lambda payload=repeated: client.post(url, payload, format="json"),
+                max(5, iterations // batch_size),
+                items_per_call=batch_size,
+                batch_size=batch_size,
+            )
+        )
+    return results
+
+
+def observation_validation_suite(gateway, iterations):
+    encounter = baker.make(Encounter)
+    user = baker.make(User)
+
+    results = []
+    for batch_size in RECORD_BATCH_SIZES:
+        payload = monitor_payload(batch_size)
+        calls = max(5, iterations // batch_size)
+        results.extend(
+            [
+                measure(
+                    "observation_validation.per_item",
+                    lambda payload=payload: [
+                        build_observation(encounter, observation, user)
+                        for observation in payload
+                    ],
+                    calls,
+                    items_per_call=batch_size,
+                    batch_size=batch_size,
+                ),
+                measure(
+                    "observation_validation.batch",
+                    lambda payload=payload: build_observations_batch(
+                        encounter, payload, user
+                    ),
+                    calls,
+                    items_per_call=batch_size,
+                    batch_size=batch_size,
+                ),
+            ]
+        )
+    return results
+
+
+def position_presets_suite(gateway, iterations):
+    camera = baker.make(Device, care_type="camera", metadata={})
+    location = baker.make(FacilityLocation)
+    baker.make(
+        PositionPreset,
+        camera=camera,
+        location=location,
+        ptz={"x": 0.0, "y": 0.0, "zoom": 0.0},
+        _quantity=PRESET_COUNT,
+    )
+    user = baker.make(User, is_superuser=True)
+    client = APIClient()
+    client.force_authenticate(user)
+    url = resolve_url(
+        "camera-position-presets-list",
+        "/api/camera_device/{camera_external_id}/position_presets/",
+        camera_external_id=camera.external_id,
+    )
+    check_response(client.get(url))
+
+    return [
+        measure(
+            "position_presets.list",
+            lambda: client.get(url),
+            iterations,
+            preset_count=PRESET_COUNT,
+        ),
+        measure(
+            "position_presets.list_by_location",
+            lambda: client.get(url, {"location": str(location.external_id)}),
+            iterations,
+            preset_count=PRESET_COUNT,
+        ),
+    ]
+
+
+def camera_batch_actions_suite(gateway, iterations):
+    gateway_device = make_gateway_device(gateway)
+    cameras = baker.make(
+        Device,
+        care_type="camera",
+        metadata={
+            "gateway": str(gateway_device.external_id),
+            "endpoint_address": "10.0.0.3",
+            "username": "",
+            "password": "",
+            "stream_id": "stream",
+        },
+        _quantity=CONCURRENCY,
+    )
+    user = baker.make(User, is_superuser=True)
+    client = APIClient()
+    client.force_authenticate(user)
+    status_urls = [
+        resolve_url(
+            "camera-actions-get-status",
+            "/api/camera_device/actions/{external_id}/get_status/",
+            external_id=camera.external_id,
+        )
+        for camera in cameras
+    ]
+    batch_url = resolve_url("camera-actions-batch", "/api/camera_device/actions/batch/")
+    payload = {
+        "action": "get_status",
+        "cameras": [str(camera.external_id) for camera in cameras],
+    }
+    calls = max(5, iterations // CONCURRENCY)
+
+    # the statuses would be served from the status cache after the first call,
+    # which is not what is being compared here
+    plugin_configs = getattr(settings, "PLUGIN_CONFIGS", {})
+    with override_settings(
+        PLUGIN_CONFIGS={
+            **plugin_configs,
+            CAMERA_PLUGIN_NAME: {
+                **plugin_configs.get(CAMERA_PLUGIN_NAME, {}),
+                "CARE_TELEICU_CAMERA_STATUS_CACHE_TTL": 0,
+            },
+        }
+    ):
+        check_response(client.post(batch_url, payload, format="json"))
+        return [
+            measure(
+                "camera_actions.get_status_sequential",
+                lambda: [client.get(url) for url in status_urls],
+                calls,
+                items_per_call=CONCURRENCY,
+                camera_count=CONCURRENCY,
+            ),
+            measure(
+                "camera_actions.batch_get_status",
+                lambda: client.post(batch_url, payload, format="json"),
+                calls,
+                items_per_call=CONCURRENCY,
+                camera_count=CONCURRENCY,
+            ),
+        ]
+
+
+SUITES = {
+    "gateway_client": gateway_client_suite,
+    "gateway_authentication": gateway_authentication_suite,
+    "record_ingestion": record_ingestion_suite,
+    "observation_validation": observation_validation_suite,
+    "position_presets": position_presets_suite,
+    "camera_batch_actions": camera_batch_actions_suite,
+}
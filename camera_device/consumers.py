@@ -0,0 +1,308 @@
+import asyncio
+import time
+from dataclasses import dataclass
+
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.core.exceptions import ValidationError as DjangoValidationError
+from pydantic import ValidationError as PydanticValidationError
+from rest_framework import status
+from rest_framework.exceptions import (
+    APIException,
+    NotAuthenticated,
+    NotFound,
+    PermissionDenied,
+    ValidationError,
+)
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+from camera_device.gateway_responses import get_entry_data, get_response_entry
+from camera_device.ptz_coalescer import PTZ_COMMAND_FIELDS, submit_ptz_command
+from camera_device.spec import PTZPayloadSpec
+from camera_device.status_cache import aget_camera_status, ainvalidate_camera_status
+from camera_device.viewsets.actions import (
+    GATEWAY_ACTIONS,
+    CameraActionsViewSet,
+    GotoPresetRequestSpec,
+)
+from care.emr.models.device import Device
+from care.security.authorization import AuthorizationController
+from gateway_device.async_client import AsyncGatewayClient
+from gateway_device.client import GatewayClient
+
+PTZ_MESSAGE_SPECS = {
+    "goto_preset": GotoPresetRequestSpec,
+    "absolute_move": PTZPayloadSpec,
+    "relative_move": PTZPayloadSpec,
+}
+
+# close codes of the channel, in the 4000-4999 range reserved for applications
+CLOSE_UNAUTHENTICATED = 4001
+CLOSE_UNAUTHORIZED = 4003
+# how long a connection may stay open without authenticating
+AUTHENTICATION_TIMEOUT = 5
+# how often the permission of the user to control the camera is checked again
+REAUTHORIZE_INTERVAL = 30
+
+
+def camera_ptz_group_name(camera_external_id) -> str:
+    return f"camera_ptz.{camera_external_id}"
+
+
+@dataclass
+class PTZContext:
+    """
+    The camera and gateway resolved when the channel is authorized, reused by
+    every command sent over it.
+    """
+
+    camera_external_id: str
+    camera_data: dict
+    client: GatewayClient
+    async_client: AsyncGatewayClient
+
+
+def authenticate_token(token: str) -> tuple:
+    """
+    Returns the user of the access token and the time it expires at.
+    """
+    authentication = JWTAuthentication()
+    validated_token = authentication.get_validated_token(token)
+    return authentication.get_user(validated_token), validated_token.get("exp")
+
+
+def get_ptz_context(camera_external_id, user) -> PTZContext:
+    """
+    Authorizes the user to control the camera and resolves the gateway context
+    of the camera, the same way `CameraActionsViewSet` does per request.
+    """
+    try:
+        camera = Device.objects.filter(
+            care_type="camera", external_id=camera_external_id
+        ).first()
+    except (ValueError, DjangoValidationError):
+        camera = None
+    if camera is None:
+        raise NotFound("Camera not found")
+    if not AuthorizationController.call("can_control_camera_ptz", user, camera):
+        raise PermissionDenied("You do not have permission to control device")
+
+    viewset = CameraActionsViewSet()
+    gateway_device = viewset.get_gateway_device(camera)
+    return PTZContext(
+        camera_external_id=str(camera.external_id),
+        camera_data=viewset.get_gateway_request_data(camera),
+        client=GatewayClient(gateway_device),
+        async_client=AsyncGatewayClient(gateway_device),
+    )
+
+
+class CameraPTZConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Persistent PTZ control channel for a camera.
+
+    The channel is authenticated with the session of the connection, or with
+    an `{"type": "authenticate", "token": "<access token>"}` first message
+    within `AUTHENTICATION_TIMEOUT` seconds, and authorized for
+    `can_control_camera_ptz`. The permission is checked again every
+    `REAUTHORIZE_INTERVAL` seconds, and the channel is closed once the access
+    token expires. After that it accepts
+
+        {"type": "relative_move", "id": "...", "x": 0.1, "y": 0, "zoom": 0}
+        {"type": "absolute_move", "id": "...", "x": 0.1, "y": 0, "zoom": 0}
+        {"type": "goto_preset", "id": "...", "preset": 1}
+        {"type": "get_status"}
+
+    Moves go through the PTZ coalescer of the camera and are answered with a
+    `result` message. The status of the camera after a move is pushed as a
+    `status` message to every channel of the camera.
+    """
+
+    context: PTZContext | None = None
+
+    async def connect(self):
+        self.camera_external_id = self.scope["url_route"]["kwargs"]["external_id"]
+        self.group_name = None
+        self.user = None
+        self.expires_at = None
+        self.authorized_at = None
+        self.authentication_deadline = None
+        self.token_expiry = None
+        await self.accept()
+        user = self.scope.get("user")
+        if user is not None and user.is_authenticated:
+            if await self.authorize(user):
+                await self.send_json({"type": "ready"})
+        else:
+            self.authentication_deadline = asyncio.create_task(
+                self.close_unauthenticated()
+            )
+
+    async def disconnect(self, code):
+        for task in (self.authentication_deadline, self.token_expiry):
+            if task is not None:
+                task.cancel()
+        if self.group_name and self.channel_layer is not None:
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def close_unauthenticated(self):
+        await asyncio.sleep(AUTHENTICATION_TIMEOUT)
+        if self.context is None:
+            await self.send_error(NotAuthenticated())
+            await self.close(code=CLOSE_UNAUTHENTICATED)
+
+    async def close_when_expired(self):
+        await asyncio.sleep(max(self.expires_at - time.time(), 0))
+        await self.reject(NotAuthenticated("Token has expired"))
+
+    async def reject(self, exc: APIException, message_id=None):
+        self.context = None
+        await self.send_error(exc, message_id)
+        await self.close(code=CLOSE_UNAUTHORIZED)
+
+    async def authorize(self, user) -> bool:
+        try:
+            self.context = await database_sync_to_async(get_ptz_context)(
+                self.camera_external_id, user
+            )
+        except APIException as e:
+            await self.reject(e)
+            return False
+        self.user = user
+        self.authorized_at = time.monotonic()
+        if self.group_name is None and self.channel_layer is not None:
+            self.group_name = camera_ptz_group_name(self.context.camera_external_id)
+            await self.channel_layer.group_add(self.group_name, self.channel_name)
+        return True
+
+    async def authenticate(self, content):
+        try:
+            user, self.expires_at = await database_sync_to_async(
+                authenticate_token
+            )(content.get("token") or "")
+        except APIException as e:
+            await self.reject(e)
+            return
+        if await self.authorize(user):
+            self.authentication_deadline.cancel()
+            if self.expires_at is not None:
+                self.token_expiry = asyncio.create_task(self.close_when_expired())
+            await self.send_json({"type": "ready"})
+
+    async def ensure_authorized(self, message_id=None) -> bool:
+        """
+        Closes the channel once the access token has expired or the user may
+        no longer control the camera.
+        """
+        if self.expires_at is not None and time.time() >= self.expires_at:
+            await self.reject(NotAuthenticated("Token has expired"), message_id)
+            return False
+        if time.monotonic() - self.authorized_at >= REAUTHORIZE_INTERVAL:
+            return await self.authorize(self.user)
+        return True
+
+    async def send_error(self, exc: APIException, message_id=None):
+        await self.send_json(
+            {
+                "type": "error",
+                "id": message_id,
+                "status": exc.status_code,
+                "error": exc.detail,
+            }
+        )
+
+    async def receive_json(self, content, **kwargs):
+        message_type = content.get("type") if isinstance(content, dict) else None
+        message_id = content.get("id") if isinstance(content, dict) else None
+        if self.context is None:
+            if message_type == "authenticate" and self.user is None:
+                return await self.authenticate(content)
+            return await self.send_error(NotAuthenticated(), message_id)
+        if not await self.ensure_authorized(message_id):
+            return
+
+        try:
+            if message_type in PTZ_MESSAGE_SPECS:
+                await self.move(message_type, content)
+            elif message_type == "get_status":
+                data = await self.get_status()
+                await self.send_json({"type": "status", "id": message_id, "data": data})
+            else:
+                raise ValidationError({"type": "Unknown message type"})
+        except PydanticValidationError as e:
+            await self.send_json(
+                {
+                    "type": "error",
+                    "id": message_id,
+                    "status": status.HTTP_400_BAD_REQUEST,
+                    "error": e.errors(include_url=False, include_context=False),
+                }
+            )
+        except APIException as e:
+            await self.send_error(e, message_id)
+
+    async def get_status(self):
+        context = self.context
+        method, endpoint, *_ = GATEWAY_ACTIONS["get_status"]
+
+        async def fetch():
+            return get_response_entry(
+                await context.async_client.request(
+                    method, endpoint, context.camera_data, as_http_response=True
+                )
+            )
+
+        return get_entry_data(
+            await aget_camera_status(context.camera_external_id, fetch)
+        )
+
+    async def move(self, action, content):
+        context = self.context
+        payload = PTZ_MESSAGE_SPECS[action](**content).model_dump(mode="json")
+        method, endpoint, *_ = GATEWAY_ACTIONS[action]
+        camera_data = {
+            key: value
+            for key, value in context.camera_data.items()
+            if key not in PTZ_COMMAND_FIELDS
+        }
+        # the coalescer waits on the cache, so it runs in a thread of its own
+        # rather than on the event loop
+        result = await sync_to_async(submit_ptz_command, thread_sensitive=False)(
+            context.camera_external_id,
+            action,
+            method,
+            endpoint,
+            payload,
+            lambda method, endpoint, data: get_response_entry(
+                context.client.request(
+                    method, endpoint, {**camera_data, **data}, as_http_response=True
+                )
+            ),
+            command_id=content.get("id"),
+        )
+        await ainvalidate_camera_status(context.camera_external_id)
+        entry = result.pop("response")
+        try:
+            result["data"] = get_entry_data(entry)
+        except APIException as e:
+            result.update(error=e.detail, status=e.status_code)
+        await self.send_json({"type": "result", **result})
+        if "error" not in result:
+            await self.push_status()
+
+    async def push_status(self):
+        try:
+            data = await self.get_status()
+        except APIException as e:
+            return await self.send_error(e)
+        if self.group_name:
+            await self.channel_layer.group_send(
+                self.group_name, {"type": "ptz.status", "data": data}
+            )
+        else:
+            await self.send_json({"type": "status", "data": data})
+
+    async def ptz_status(self, event):
+        if self.context is not None and await self.ensure_authorized():
+            await self.send_json({"type": "status", "data": event["data"]})
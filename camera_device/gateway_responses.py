@@ -0,0 +1,64 @@
+"""
+Cacheable form of the gateway responses that are passed through to the
+client, shared by the camera status and stream token caches and the PTZ
+coalescer.
+"""
+
+import json
+
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from gateway_device.client import GatewayAPIException
+
+
+def get_response_entry(response: HttpResponse) -> dict:
+    return {
+        "content": response.content,
+        "content_type": response["Content-Type"],
+        "status": response.status_code,
+    }
+
+
+def get_exception_entry(exc: APIException) -> dict:
+    """
+    Entry of the error response DRF renders for the exception, for failures
+    reported in place of a gateway response.
+    """
+    detail = exc.detail
+    if not isinstance(detail, (dict, list)):
+        detail = {"detail": detail}
+    return {
+        "content": json.dumps(detail).encode(),
+        "content_type": "application/json",
+        "status": exc.status_code,
+    }
+
+
+def get_entry_response(entry: dict) -> HttpResponse:
+    return HttpResponse(
+        entry["content"], content_type=entry["content_type"], status=entry["status"]
+    )
+
+
+def get_entry_data(entry: dict):
+    """
+    Decoded body of the gateway response, raising its error as the client
+    does for responses that are not passed through.
+    """
+    if not is_successful(entry):
+        raise GatewayAPIException(
+            entry["content"].decode(errors="replace"), entry["status"]
+        )
+    try:
+        return json.loads(entry["content"])
+    except ValueError as e:
+        raise GatewayAPIException(
+            {"error": "Invalid JSON response from gateway device"},
+            status.HTTP_502_BAD_GATEWAY,
+        ) from e
+
+
+def is_successful(entry: dict) -> bool:
+    return entry["status"] < status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,306 @@
+"""
+Per camera coalescing of PTZ commands.
+
+A command is forwarded to the gateway right away when the camera is idle.
+Commands arriving while a command is in flight are merged into a single
+pending command, which is forwarded as soon as the camera is idle again:
+
+- relative moves are summed,
+- a relative move after an absolute move offsets the absolute position,
+- a relative move after a preset is applied once the camera is at the
+  preset, summed with the relative moves that follow,
+- absolute moves and presets supersede anything pending.
+
+The gateway response of the net command is passed through to every command
+merged into it. At most `CARE_TELEICU_CAMERA_PTZ_MAX_WAITING` commands wait
+on a camera, further commands are turned away until the pending one is
+forwarded.
+
+The state is kept in the cache, so commands are coalesced across workers.
+The worker forwarding a command keeps a heartbeat in the cache while it
+does, so that the commands waiting on a worker that died are taken over as
+soon as its heartbeat expires.
+"""
+
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from camera_device.gateway_responses import get_exception_entry, is_successful
+from camera_device.settings import plugin_settings as settings
+
+PTZ_AXES = ("x", "y", "zoom")
+# fields of the gateway request that make up the command, the rest (the
+# camera address and credentials) is added by the worker forwarding it and
+# never stored in the cache
+PTZ_COMMAND_FIELDS = (*PTZ_AXES, "preset")
+LOCK_TIMEOUT = 2
+POLL_INTERVAL = 0.02
+RESULT_TTL = 60
+HEARTBEAT_INTERVAL = 1
+# a command in flight without a heartbeat for this long belongs to a worker
+# that died without releasing the camera
+HEARTBEAT_TIMEOUT = 3
+
+
+class PTZCommandTimeout(APIException):
+    status_code = status.HTTP_504_GATEWAY_TIMEOUT
+    default_detail = "Timed out waiting for the camera to be moved"
+    default_code = "ptz_command_timeout"
+
+
+class PTZQueueFull(APIException):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    default_detail = "Too many commands are waiting for the camera to be moved"
+    default_code = "ptz_queue_full"
+
+
+class PTZLockTimeout(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "Timed out waiting for the camera's command queue"
+    default_code = "ptz_lock_timeout"
+
+
+def ptz_state_cache_key(camera_external_id) -> str:
+    return f"camera_ptz:{camera_external_id}"
+
+
+def ptz_lock_cache_key(camera_external_id) -> str:
+    return f"camera_ptz_lock:{camera_external_id}"
+
+
+def ptz_result_cache_key(batch_id: str) -> str:
+    return f"camera_ptz_result:{batch_id}"
+
+
+def ptz_heartbeat_cache_key(camera_external_id) -> str:
+    return f"camera_ptz_heartbeat:{camera_external_id}"
+
+
+class _CameraLock:
+    """
+    Short lived lock of the coalescing state of a camera, held by a unique
+    token so that a holder whose lock expired does not release the lock of
+    the next holder.
+    """
+
+    def __init__(self, camera_external_id):
+        self.key = ptz_lock_cache_key(camera_external_id)
+        self.token = str(uuid.uuid4())
+
+    def __enter__(self):
+        deadline = time.monotonic() + LOCK_TIMEOUT
+        while not cache.add(self.key, self.token, timeout=LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise PTZLockTimeout
+            time.sleep(POLL_INTERVAL / 4)
+
+    def __exit__(self, *exc_info):
+        # the cache has no compare-and-delete, the window between the two
+        # calls is far shorter than the lock timeout
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+
+class _Heartbeat:
+    """
+    Keeps the command in flight for the camera alive while it is forwarded,
+    under a unique token like `_CameraLock`.
+    """
+
+    def __init__(self, camera_external_id):
+        self.key = ptz_heartbeat_cache_key(camera_external_id)
+        self.token = str(uuid.uuid4())
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def beat(self):
+        cache.set(self.key, self.token, timeout=HEARTBEAT_TIMEOUT)
+
+    def run(self):
+        while not self.stopped.wait(HEARTBEAT_INTERVAL):
+            self.beat()
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stops renewing the heartbeat, which stays alive until released or
+        expired.
+        """
+        self.stopped.set()
+        self.thread.join()
+
+    def release(self):
+        if cache.get(self.key) == self.token:
+            cache.delete(self.key)
+
+
+def _add_relative(data: dict, relative: dict) -> dict:
+    return {**data, **{axis: data[axis] + relative[axis] for axis in PTZ_AXES}}
+
+
+def merge_commands(pending: dict, command: dict) -> dict:
+    """
+    Returns the net command of the pending command followed by `command`.
+    """
+    commands = pending["commands"] + command["commands"]
+    if command["action"] != "relative_move":
+        # the merged command keeps the id waited on by the pending commands
+        return {**command, "id": pending["id"], "commands": commands}
+    if pending["action"] == "goto_preset":
+        then = pending.get("then")
+        if then is None:
+            then = {key: command[key] for key in ("action", "method", "endpoint")}
+            then["data"] = command["data"]
+        else:
+            then = {**then, "data": _add_relative(then["data"], command["data"])}
+        return {**pending, "then": then, "commands": commands}
+    data = _add_relative(pending["data"], command["data"])
+    return {**pending, "data": data, "commands": commands}
+
+
+def _is_in_flight(camera_external_id, state) -> bool:
+    return bool(state.get("in_flight_since")) and (
+        cache.get(ptz_heartbeat_cache_key(camera_external_id)) is not None
+    )
+
+
+def _claim(camera_external_id, state) -> _Heartbeat:
+    """
+    Marks the camera busy, with the caller holding the camera lock, and
+    returns the heartbeat to forward the command with.
+    """
+    state["in_flight_since"] = time.time()
+    # the heartbeat is set before the lock is released, so that the command
+    # is never seen in flight without one
+    heartbeat = _Heartbeat(camera_external_id)
+    heartbeat.beat()
+    return heartbeat
+
+
+def _save_state(camera_external_id, state):
+    cache.set(ptz_state_cache_key(camera_external_id), state, timeout=RESULT_TTL)
+
+
+def _forward(camera_external_id, batch: dict, forward, heartbeat) -> dict:
+    heartbeat.start()
+    try:
+        steps = [batch]
+        if then := batch.get("then"):
+            steps.append(then)
+        forwarded = []
+        try:
+            for step in steps:
+                forwarded.append(step["action"])
+                response = forward(step["method"], step["endpoint"], step["data"])
+                if not is_successful(response):
+                    # the relative move is not applied to a preset not reached
+                    break
+        except APIException as e:
+            response = get_exception_entry(e)
+        result = {
+            "response": response,
+            "action": ",".join(forwarded),
+            "commands": batch["commands"],
+        }
+        cache.set(ptz_result_cache_key(batch["id"]), result, timeout=RESULT_TTL)
+        return result
+    finally:
+        # the heartbeat outlives the reset of the state, so that the camera is
+        # not taken over in between, but is no longer renewed in case the
+        # next command claims the camera right after
+        heartbeat.stop()
+        try:
+            with _CameraLock(camera_external_id):
+                state = cache.get(ptz_state_cache_key(camera_external_id)) or {}
+                state["in_flight_since"] = None
+                _save_state(camera_external_id, state)
+        except PTZLockTimeout:
+            # releasing the heartbeat frees the camera all the same
+            pass
+        heartbeat.release()
+
+
+def _take_pending(camera_external_id, batch_id: str) -> tuple | None:
+    """
+    Claims the pending command for forwarding if the camera is idle and the
+    pending command is still `batch_id`, and returns it with the heartbeat to
+    forward it with.
+    """
+    state = cache.get(ptz_state_cache_key(camera_external_id)) or {}
+    if _is_in_flight(camera_external_id, state):
+        return None
+    with _CameraLock(camera_external_id):
+        state = cache.get(ptz_state_cache_key(camera_external_id)) or {}
+        pending = state.get("pending")
+        if (
+            _is_in_flight(camera_external_id, state)
+            or not pending
+            or pending["id"] != batch_id
+        ):
+            return None
+        state["pending"] = None
+        heartbeat = _claim(camera_external_id, state)
+        _save_state(camera_external_id, state)
+    return pending, heartbeat
+
+
+def submit_ptz_command(
+    camera_external_id, action, method, endpoint, data, forward, command_id=None
+) -> dict:
+    """
+    Submits the command for the camera and waits for the net command it was
+    merged into to be forwarded with `forward(method, endpoint, data)`, where
+    `data` holds just the `PTZ_COMMAND_FIELDS` of the command, and which
+    returns the gateway response in the form of `get_response_entry`.
+
+    Returns the gateway response of the forwarded command as `response`, with
+    the action that was forwarded and the ids of the commands merged into it.
+    Raises `PTZQueueFull` when too many commands are waiting on the camera.
+    """
+    command_id = command_id or str(uuid.uuid4())
+    camera_external_id = str(camera_external_id)
+    command = {
+        "id": str(uuid.uuid4()),
+        "action": action,
+        "method": method,
+        "endpoint": endpoint,
+        "data": {key: data[key] for key in PTZ_COMMAND_FIELDS if key in data},
+        "commands": [command_id],
+    }
+
+    with _CameraLock(camera_external_id):
+        state = cache.get(ptz_state_cache_key(camera_external_id)) or {}
+        if not _is_in_flight(camera_external_id, state) and not state.get("pending"):
+            heartbeat = _claim(camera_external_id, state)
+            batch = command
+        else:
+            pending = state.get("pending")
+            if pending and len(pending["commands"]) >= (
+                settings.CARE_TELEICU_CAMERA_PTZ_MAX_WAITING
+            ):
+                raise PTZQueueFull
+            state["pending"] = merge_commands(pending, command) if pending else command
+            batch = None
+            batch_id = state["pending"]["id"]
+        _save_state(camera_external_id, state)
+
+    if batch is not None:
+        result = _forward(camera_external_id, batch, forward, heartbeat)
+        return {"command": command_id, **result}
+
+    deadline = time.monotonic() + settings.CARE_TELEICU_CAMERA_PTZ_COALESCE_TIMEOUT
+    while time.monotonic() < deadline:
+        if result := cache.get(ptz_result_cache_key(batch_id)):
+            return {"command": command_id, **result}
+        if claimed := _take_pending(camera_external_id, batch_id):
+            result = _forward(camera_external_id, *claimed, forward)
+            return {"command": command_id, **result}
+        time.sleep(POLL_INTERVAL)
+    raise PTZCommandTimeout
@@ -0,0 +1,11 @@
+from django.urls import path
+
+from camera_device.consumers import CameraPTZConsumer
+
+websocket_urlpatterns = [
+    path(
+        "ws/camera_device/<str:external_id>/ptz/",
+        CameraPTZConsumer.as_asgi(),
+        name="camera-ptz-channel",
+    ),
+]
@@ -101,6 +101,20 @@ REQUIRED_SETTINGS = {
 }
 
 DEFAULTS = {
+    "CARE_TELEICU_CAMERA_BATCH_MAX_CAMERAS": 32,
+    "CARE_TELEICU_CAMERA_BATCH_CONCURRENCY": 16,
+    # not used for the get_status action while gateway responses are streamed
+    "CARE_TELEICU_CAMERA_STATUS_CACHE_TTL": 2,
+    "CARE_TELEICU_CAMERA_STREAM_TOKEN_CACHE": True,
+    "CARE_TELEICU_CAMERA_STREAM_TOKEN_EXPIRY_MARGIN": 30,
+    "CARE_TELEICU_CAMERA_STREAM_TOKEN_REFRESH_AHEAD": 120,
+    "CARE_TELEICU_CAMERA_STREAM_TOKEN_DEFAULT_TTL": 300,
+    "CARE_TELEICU_CAMERA_PTZ_COALESCE": True,
+    # how long a merged PTZ command waits for the command in flight
+    "CARE_TELEICU_CAMERA_PTZ_COALESCE_TIMEOUT": 10,
+    # how many PTZ commands may wait on the command in flight for a camera,
+    # each of them holding a worker while it does
+    "CARE_TELEICU_CAMERA_PTZ_MAX_WAITING": 4,
 }
 
 plugin_settings = PluginSettings(
@@ -0,0 +1,211 @@
+"""
+Short lived cache of the camera statuses shared by everyone watching a
+camera.
+
+The gateway response is cached as is, so that it can be passed through to
+the client, and only when it is successful. Concurrent misses for a camera
+share a single gateway call, within a worker through an in-flight future and
+across workers through a cache lock, and the cached status is dropped
+whenever the camera is moved.
+"""
+
+import asyncio
+import threading
+import time
+import weakref
+from concurrent.futures import Future
+
+from django.core.cache import cache
+
+from camera_device.gateway_responses import is_successful
+from camera_device.settings import plugin_settings as settings
+
+# how long to wait for the status fetched by another worker before fetching
+# it ourselves, and how often to check for it meanwhile
+COALESCE_TIMEOUT = 5
+COALESCE_POLL_INTERVAL = 0.05
+
+_in_flight: dict[str, Future] = {}
+_in_flight_lock = threading.Lock()
+_loop_in_flight: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Future]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def camera_status_cache_key(camera_external_id) -> str:
+    return f"camera_status:{camera_external_id}"
+
+
+def camera_status_lock_cache_key(camera_external_id) -> str:
+    return f"camera_status_lock:{camera_external_id}"
+
+
+def camera_status_generation_cache_key(camera_external_id) -> str:
+    return f"camera_status_generation:{camera_external_id}"
+
+
+def invalidate_camera_status(camera_external_id):
+    """
+    Drops the cached status of the camera, and makes sure that a status
+    being fetched while the camera moves is not cached.
+    """
+    generation_key = camera_status_generation_cache_key(camera_external_id)
+    cache.add(generation_key, 0, timeout=None)
+    try:
+        cache.incr(generation_key)
+    except ValueError:
+        # key got evicted in between
+        cache.set(generation_key, 1, timeout=None)
+    cache.delete(camera_status_cache_key(camera_external_id))
+
+
+async def ainvalidate_camera_status(camera_external_id):
+    """
+    asyncio counterpart of `invalidate_camera_status`.
+    """
+    generation_key = camera_status_generation_cache_key(camera_external_id)
+    await cache.aadd(generation_key, 0, timeout=None)
+    try:
+        await cache.aincr(generation_key)
+    except ValueError:
+        # key got evicted in between
+        await cache.aset(generation_key, 1, timeout=None)
+    await cache.adelete(camera_status_cache_key(camera_external_id))
+
+
+def _cached(entry):
+    return None if entry is None else entry["status"]
+
+
+def _store(camera_external_id, generation, status):
+    if not is_successful(status):
+        return
+    ttl = settings.CARE_TELEICU_CAMERA_STATUS_CACHE_TTL
+    current = cache.get(camera_status_generation_cache_key(camera_external_id), 0)
+    if current == generation:
+        cache.set(
+            camera_status_cache_key(camera_external_id),
+            {"status": status, "generation": generation},
+            timeout=ttl,
+        )
+
+
+def _fetch_coalesced(camera_external_id, fetch):
+    """
+    Fetches the status once across the workers, waiting for the worker that
+    holds the lock if there is one.
+    """
+    lock_key = camera_status_lock_cache_key(camera_external_id)
+    deadline = time.monotonic() + COALESCE_TIMEOUT
+    while not cache.add(lock_key, 1, timeout=COALESCE_TIMEOUT):
+        time.sleep(COALESCE_POLL_INTERVAL)
+        status = _cached(cache.get(camera_status_cache_key(camera_external_id)))
+        if status is not None:
+            return status
+        if time.monotonic() > deadline:
+            return fetch()
+    try:
+        generation = cache.get(
+            camera_status_generation_cache_key(camera_external_id), 0
+        )
+        status = fetch()
+        _store(camera_external_id, generation, status)
+        return status
+    finally:
+        cache.delete(lock_key)
+
+
+def get_camera_status(camera_external_id, fetch):
+    """
+    Returns the cached gateway response to the status request of the camera,
+    calling `fetch` to get it from the gateway on a miss. `fetch` returns the
+    response in the form of `get_response_entry`.
+    """
+    if not settings.CARE_TELEICU_CAMERA_STATUS_CACHE_TTL:
+        return fetch()
+    camera_external_id = str(camera_external_id)
+    status = _cached(cache.get(camera_status_cache_key(camera_external_id)))
+    if status is not None:
+        return status
+
+    with _in_flight_lock:
+        future = _in_flight.get(camera_external_id)
+        leader = future is None
+        if leader:
+            future = _in_flight[camera_external_id] = Future()
+    if not leader:
+        return future.result()
+
+    try:
+        status = _fetch_coalesced(camera_external_id, fetch)
+        future.set_result(status)
+        return status
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _in_flight_lock:
+            _in_flight.pop(camera_external_id, None)
+
+
+async def _afetch_coalesced(camera_external_id, fetch):
+    lock_key = camera_status_lock_cache_key(camera_external_id)
+    deadline = time.monotonic() + COALESCE_TIMEOUT
+    while not await cache.aadd(lock_key, 1, timeout=COALESCE_TIMEOUT):
+        await asyncio.sleep(COALESCE_POLL_INTERVAL)
+        entry = await cache.aget(camera_status_cache_key(camera_external_id))
+        if (status := _cached(entry)) is not None:
+            return status
+        if time.monotonic() > deadline:
+            return await fetch()
+    try:
+        generation = await cache.aget(
+            camera_status_generation_cache_key(camera_external_id), 0
+        )
+        status = await fetch()
+        current = await cache.aget(
+            camera_status_generation_cache_key(camera_external_id), 0
+        )
+        if current == generation and is_successful(status):
+            await cache.aset(
+                camera_status_cache_key(camera_external_id),
+                {"status": status, "generation": generation},
+                timeout=settings.CARE_TELEICU_CAMERA_STATUS_CACHE_TTL,
+            )
+        return status
+    finally:
+        await cache.adelete(lock_key)
+
+
+async def aget_camera_status(camera_external_id, fetch):
+    """
+    asyncio counterpart of `get_camera_status`, `fetch` is a coroutine
+    function.
+    """
+    if not settings.CARE_TELEICU_CAMERA_STATUS_CACHE_TTL:
+        return await fetch()
+    camera_external_id = str(camera_external_id)
+    status = _cached(await cache.aget(camera_status_cache_key(camera_external_id)))
+    if status is not None:
+        return status
+
+    in_flight = _loop_in_flight.setdefault(asyncio.get_running_loop(), {})
+    if future := in_flight.get(camera_external_id):
+        return await asyncio.shield(future)
+
+    future = asyncio.get_running_loop().create_future()
+    in_flight[camera_external_id] = future
+    try:
+        status = await _afetch_coalesced(camera_external_id, fetch)
+        future.set_result(status)
+        return status
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as e:
+        future.set_exception(e)
+        # mark the exception as retrieved, in case there are no other waiters
+        future.exception()
+        raise
+    finally:
+        in_flight.pop(camera_external_id, None)
@@ -0,0 +1,148 @@
+"""
+Video feed tokens shared by all viewers of a camera stream.
+
+The gateway responses with the tokens are cached per camera, stream and
+camera endpoint until shortly before the expiry in the token, and refreshed
+in the background while still being served once they near it.
+"""
+
+import logging
+import threading
+import time
+
+import jwt
+from django.core.cache import cache
+from rest_framework.exceptions import APIException
+
+from camera_device.gateway_responses import get_entry_data, is_successful
+from camera_device.settings import plugin_settings as settings
+
+logger = logging.getLogger(__name__)
+
+REFRESH_LOCK_TIMEOUT = 30
+
+
+def stream_token_cache_key(camera_external_id, stream_id, endpoint_address) -> str:
+    return f"camera_stream_token:{camera_external_id}:{stream_id}:{endpoint_address}"
+
+
+def stream_token_refresh_lock_cache_key(
+    camera_external_id, stream_id, endpoint_address
+) -> str:
+    return (
+        f"camera_stream_token_refresh:{camera_external_id}:{stream_id}:"
+        f"{endpoint_address}"
+    )
+
+
+def get_token_expiry(entry) -> float:
+    """
+    Expiry of the token in the gateway response, or the default lifetime
+    from now if it carries none.
+    """
+    try:
+        token = get_entry_data(entry)["token"]
+        claims = jwt.decode(token, options={"verify_signature": False})
+        return float(claims["exp"])
+    except (APIException, jwt.PyJWTError, KeyError, TypeError, ValueError):
+        return time.time() + settings.CARE_TELEICU_CAMERA_STREAM_TOKEN_DEFAULT_TTL
+
+
+def store_stream_token(camera_external_id, stream_id, endpoint_address, entry):
+    """
+    Caches the gateway response, in the form of `get_response_entry`, if it
+    is successful.
+    """
+    if not settings.CARE_TELEICU_CAMERA_STREAM_TOKEN_CACHE or not is_successful(
+        entry
+    ):
+        return
+    expires_at = get_token_expiry(entry)
+    timeout = (
+        expires_at
+        - time.time()
+        - settings.CARE_TELEICU_CAMERA_STREAM_TOKEN_EXPIRY_MARGIN
+    )
+    if timeout > 0:
+        cache.set(
+            stream_token_cache_key(camera_external_id, stream_id, endpoint_address),
+            {"response": entry, "expires_at": expires_at},
+            timeout=int(timeout),
+        )
+
+
+def refresh_stream_token(camera_external_id, stream_id, endpoint_address, fetch):
+    """
+    Fetches a new token for the stream, for the caller holding the refresh
+    lock.
+    """
+    try:
+        entry = fetch()
+    except Exception as e:
+        error = e
+    else:
+        error = None if is_successful(entry) else f"status {entry['status']}"
+    if error is not None:
+        # leave the lock to expire, which backs off the refreshes of a
+        # failing gateway while the cached token is still served
+        logger.warning(
+            "Failed to refresh the stream token of camera %s: %s",
+            camera_external_id,
+            error,
+        )
+        return
+    store_stream_token(camera_external_id, stream_id, endpoint_address, entry)
+    cache.delete(
+        stream_token_refresh_lock_cache_key(
+            camera_external_id, stream_id, endpoint_address
+        )
+    )
+
+
+def get_cached_stream_token(camera_external_id, stream_id, endpoint_address, fetch):
+    """
+    Returns the cached gateway response for the stream, if any, and starts a
+    background refresh with `fetch` when it nears expiry, unless another
+    worker already is refreshing it.
+    """
+    if not settings.CARE_TELEICU_CAMERA_STREAM_TOKEN_CACHE:
+        return None
+    entry = cache.get(
+        stream_token_cache_key(camera_external_id, stream_id, endpoint_address)
+    )
+    if entry is None:
+        return None
+    refresh_at = (
+        entry["expires_at"]
+        - settings.CARE_TELEICU_CAMERA_STREAM_TOKEN_EXPIRY_MARGIN
+        - settings.CARE_TELEICU_CAMERA_STREAM_TOKEN_REFRESH_AHEAD
+    )
+    if time.time() >= refresh_at and cache.add(
+        stream_token_refresh_lock_cache_key(
+            camera_external_id, stream_id, endpoint_address
+        ),
+        1,
+        timeout=REFRESH_LOCK_TIMEOUT,
+    ):
+        threading.Thread(
+            target=refresh_stream_token,
+            args=(camera_external_id, stream_id, endpoint_address, fetch),
+            daemon=True,
+        ).start()
+    return entry["response"]
+
+
+def get_stream_token(camera_external_id, stream_id, endpoint_address, fetch):
+    """
+    Returns the gateway response with the video feed token of the stream,
+    calling `fetch` to get a new one from the gateway if none is cached.
+    """
+    if (
+        response := get_cached_stream_token(
+            camera_external_id, stream_id, endpoint_address, fetch
+        )
+    ) is not None:
+        return response
+    response = fetch()
+    store_stream_token(camera_external_id, stream_id, endpoint_address, response)
+    return response
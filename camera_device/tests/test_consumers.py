@@ -0,0 +1,138 @@
+import json
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import AnonymousUser
+from django.test import SimpleTestCase, override_settings
+from rest_framework_simplejwt.exceptions import InvalidToken
+
+from camera_device.consumers import (
+    CLOSE_UNAUTHENTICATED,
+    CLOSE_UNAUTHORIZED,
+    PTZContext,
+)
+from camera_device.routing import websocket_urlpatterns
+
+CAMERA_ID = "0d5d8a6e-3c1b-4f8e-9a57-6f1f3b2d9c41"
+CAMERA_STATUS = {
+    "position": {"x": 0.1, "y": 0.0, "zoom": 0.0},
+    "moveStatus": {"panTilt": "IDLE", "zoom": "IDLE"},
+    "error": "NO error",
+}
+
+application = URLRouter(websocket_urlpatterns)
+
+
+def ptz_context():
+    return PTZContext(
+        camera_external_id=CAMERA_ID,
+        camera_data={
+            "hostname": "192.168.1.64",
+            "port": 80,
+            "username": "admin",
+            "password": "secret",
+        },
+        client=MagicMock(),
+        async_client=MagicMock(),
+    )
+
+
+def status_entry():
+    return {
+        "content": json.dumps(CAMERA_STATUS).encode(),
+        "content_type": "application/json",
+        "status": 200,
+    }
+
+
+@override_settings(
+    CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}}
+)
+class CameraPTZConsumerTest(SimpleTestCase):
+    async def connect(self, user) -> WebsocketCommunicator:
+        communicator = WebsocketCommunicator(
+            application, f"/ws/camera_device/{CAMERA_ID}/ptz/"
+        )
+        communicator.scope["user"] = user
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def assert_closed(self, communicator, code):
+        output = await communicator.receive_output()
+        self.assertEqual(output["type"], "websocket.close")
+        self.assertEqual(output["code"], code)
+
+    async def test_invalid_token_closes_the_channel(self):
+        communicator = await self.connect(AnonymousUser())
+        with patch(
+            "camera_device.consumers.authenticate_token", side_effect=InvalidToken()
+        ):
+            await communicator.send_json_to({"type": "authenticate", "token": "x"})
+            message = await communicator.receive_json_from()
+        self.assertEqual(message["type"], "error")
+        self.assertEqual(message["status"], 401)
+        await self.assert_closed(communicator, CLOSE_UNAUTHORIZED)
+        await communicator.disconnect()
+
+    async def test_unauthenticated_channel_is_closed(self):
+        with patch("camera_device.consumers.AUTHENTICATION_TIMEOUT", 0):
+            communicator = await self.connect(AnonymousUser())
+            message = await communicator.receive_json_from()
+        self.assertEqual(message["type"], "error")
+        await self.assert_closed(communicator, CLOSE_UNAUTHENTICATED)
+        await communicator.disconnect()
+
+    @patch(
+        "camera_device.consumers.ainvalidate_camera_status", new_callable=AsyncMock
+    )
+    @patch("camera_device.consumers.aget_camera_status", new_callable=AsyncMock)
+    @patch("camera_device.consumers.submit_ptz_command")
+    @patch("camera_device.consumers.get_ptz_context")
+    async def test_move_broadcasts_the_status(
+        self, get_ptz_context, submit_ptz_command, aget_camera_status, invalidate
+    ):
+        get_ptz_context.side_effect = lambda *args: ptz_context()
+        submit_ptz_command.return_value = {
+            "command": "move-1",
+            "commands": ["move-1"],
+            "action": "relative_move",
+            "response": {
+                "content": b'{"status": "ok"}',
+                "content_type": "application/json",
+                "status": 200,
+            },
+        }
+        aget_camera_status.return_value = status_entry()
+        user = MagicMock(is_authenticated=True)
+
+        operator = await self.connect(user)
+        self.assertEqual(await operator.receive_json_from(), {"type": "ready"})
+        viewer = await self.connect(user)
+        self.assertEqual(await viewer.receive_json_from(), {"type": "ready"})
+
+        await operator.send_json_to(
+            {"type": "relative_move", "id": "move-1", "x": 0.1, "y": 0, "zoom": 0}
+        )
+
+        result = await operator.receive_json_from()
+        self.assertEqual(result["type"], "result")
+        self.assertEqual(result["command"], "move-1")
+        self.assertEqual(result["data"], {"status": "ok"})
+        camera_external_id, action, method, endpoint, payload, *_ = (
+            submit_ptz_command.call_args.args
+        )
+        self.assertEqual(camera_external_id, CAMERA_ID)
+        self.assertEqual(
+            (action, method, endpoint), ("relative_move", "POST", "/relativeMove")
+        )
+        self.assertEqual(payload, {"x": 0.1, "y": 0.0, "zoom": 0.0})
+        invalidate.assert_awaited_once_with(CAMERA_ID)
+
+        for communicator in (operator, viewer):
+            self.assertEqual(
+                await communicator.receive_json_from(),
+                {"type": "status", "data": CAMERA_STATUS},
+            )
+            await communicator.disconnect()
@@ -0,0 +1,119 @@
+import time
+
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from camera_device.ptz_coalescer import (
+    PTZQueueFull,
+    merge_commands,
+    ptz_heartbeat_cache_key,
+    ptz_state_cache_key,
+    submit_ptz_command,
+)
+from camera_device.settings import plugin_settings as settings
+
+CAMERA_ID = "0d5d8a6e-3c1b-4f8e-9a57-6f1f3b2d9c41"
+
+ENDPOINTS = {
+    "relative_move": "/relativeMove",
+    "absolute_move": "/absoluteMove",
+    "goto_preset": "/gotoPreset",
+}
+
+
+def command(command_id, action, **data):
+    return {
+        "id": f"batch-{command_id}",
+        "action": action,
+        "method": "POST",
+        "endpoint": ENDPOINTS[action],
+        "data": data,
+        "commands": [command_id],
+    }
+
+
+class MergeCommandsTest(SimpleTestCase):
+    def test_relative_moves_are_summed(self):
+        merged = merge_commands(
+            command("a", "relative_move", x=0.1, y=0.2, zoom=0),
+            command("b", "relative_move", x=0.3, y=-0.2, zoom=0.5),
+        )
+
+        self.assertEqual(merged["id"], "batch-a")
+        self.assertEqual(merged["action"], "relative_move")
+        self.assertEqual(merged["data"], {"x": 0.4, "y": 0.0, "zoom": 0.5})
+        self.assertEqual(merged["commands"], ["a", "b"])
+
+    def test_relative_move_offsets_an_absolute_move(self):
+        merged = merge_commands(
+            command("a", "absolute_move", x=0.5, y=0.5, zoom=0.1),
+            command("b", "relative_move", x=0.1, y=-0.1, zoom=0.1),
+        )
+
+        self.assertEqual(merged["action"], "absolute_move")
+        self.assertEqual(merged["endpoint"], "/absoluteMove")
+        self.assertEqual(merged["data"], {"x": 0.6, "y": 0.4, "zoom": 0.2})
+        self.assertNotIn("then", merged)
+
+    def test_relative_moves_follow_a_preset(self):
+        merged = merge_commands(
+            merge_commands(
+                command("a", "goto_preset", x=0.5, y=0.5, zoom=0.1),
+                command("b", "relative_move", x=0.1, y=0, zoom=0),
+            ),
+            command("c", "relative_move", x=0.1, y=0.2, zoom=0),
+        )
+
+        self.assertEqual(merged["action"], "goto_preset")
+        self.assertEqual(merged["data"], {"x": 0.5, "y": 0.5, "zoom": 0.1})
+        self.assertEqual(merged["then"]["action"], "relative_move")
+        self.assertEqual(merged["then"]["endpoint"], "/relativeMove")
+        self.assertEqual(merged["then"]["data"], {"x": 0.2, "y": 0.2, "zoom": 0})
+        self.assertEqual(merged["commands"], ["a", "b", "c"])
+
+    def test_absolute_move_supersedes_the_pending_command(self):
+        pending = merge_commands(
+            command("a", "goto_preset", x=0.5, y=0.5, zoom=0.1),
+            command("b", "relative_move", x=0.1, y=0, zoom=0),
+        )
+
+        merged = merge_commands(
+            pending, command("c", "absolute_move", x=0.2, y=0.3, zoom=0)
+        )
+
+        # the pending commands wait on the id of the pending command
+        self.assertEqual(merged["id"], "batch-a")
+        self.assertEqual(merged["action"], "absolute_move")
+        self.assertEqual(merged["data"], {"x": 0.2, "y": 0.3, "zoom": 0})
+        self.assertNotIn("then", merged)
+        self.assertEqual(merged["commands"], ["a", "b", "c"])
+
+
+class SubmitPTZCommandTest(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_turns_away_commands_beyond_the_waiting_limit(self):
+        waiting = [
+            f"waiting-{i}" for i in range(settings.CARE_TELEICU_CAMERA_PTZ_MAX_WAITING)
+        ]
+        pending = command(waiting[0], "relative_move", x=0.1, y=0, zoom=0)
+        pending["commands"] = waiting
+        cache.set(
+            ptz_state_cache_key(CAMERA_ID),
+            {"in_flight_since": time.time(), "pending": pending},
+        )
+        cache.set(ptz_heartbeat_cache_key(CAMERA_ID), "forwarding-worker")
+
+        with self.assertRaises(PTZQueueFull):
+            submit_ptz_command(
+                CAMERA_ID,
+                "relative_move",
+                "POST",
+                "/relativeMove",
+                {"x": 0.1, "y": 0, "zoom": 0},
+                forward=lambda *args: self.fail("forwarded a command"),
+            )
+
+        state = cache.get(ptz_state_cache_key(CAMERA_ID))
+        self.assertEqual(state["pending"]["commands"], waiting)
@@ -2,6 +2,7 @@ from django.conf import settings
 from rest_framework.routers import DefaultRouter, SimpleRouter
 
 from camera_device.viewsets.actions import CameraActionsViewSet
+from camera_device.viewsets.async_actions import get_async_action_urls
 from camera_device.viewsets.position_preset import CameraPositionPresetViewSet
 from camera_device.viewsets.preset_encounter_camera import PresetEncounterCameraViewSet
 
@@ -19,4 +20,4 @@ router.register(
     basename="preset-encounter-cameras",
 )
 
-urlpatterns = router.urls
+urlpatterns = router.urls + get_async_action_urls()
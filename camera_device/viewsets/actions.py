@@ -1,19 +1,90 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+
 from drf_spectacular.utils import extend_schema
-from pydantic import BaseModel
+from pydantic import UUID4, BaseModel, Field, RootModel
+from pydantic import ValidationError as PydanticValidationError
 from rest_framework.decorators import action
-from rest_framework.exceptions import ValidationError
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
+from camera_device.gateway_responses import (
+    get_entry_data,
+    get_entry_response,
+    get_response_entry,
+)
+from camera_device.ptz_coalescer import PTZ_COMMAND_FIELDS, submit_ptz_command
+from camera_device.settings import plugin_settings as settings
 from camera_device.spec import PTZPayloadSpec
+from camera_device.status_cache import get_camera_status, invalidate_camera_status
+from camera_device.stream_tokens import get_stream_token
 from care.emr.models.device import Device
 from care.security.authorization import AuthorizationController
 from rest_framework.exceptions import PermissionDenied
+from gateway_device.auth_cache import get_gateway_device
+from gateway_device.circuit_breaker import GatewayCircuitBreaker
 from gateway_device.client import GatewayClient
+from gateway_device.settings import plugin_settings as gateway_settings
+
+logger = logging.getLogger(__name__)
+
 
 class GotoPresetRequestSpec(BaseModel):
     preset: int | None
 
 
+class BatchActionRequestSpec(BaseModel):
+    action: str
+    cameras: list[UUID4] = Field(min_length=1)
+    data: dict = Field(default_factory=dict)
+
+
+class BatchActionResultSpec(BaseModel):
+    camera: str
+    status: int
+    data: Any = None
+    error: str | dict | list | None = None
+
+
+class BatchActionResponseSpec(RootModel[list[BatchActionResultSpec]]):
+    pass
+
+
+# action name -> (http method, gateway endpoint, authorization method, payload spec)
+GATEWAY_ACTIONS = {
+    "get_status": ("GET", "/status", "authorize_video_stream", None),
+    "get_presets": ("GET", "/presets", "authorize_video_stream", None),
+    "goto_preset": (
+        "POST",
+        "/gotoPreset",
+        "authorize_device_control",
+        GotoPresetRequestSpec,
+    ),
+    "absolute_move": (
+        "POST",
+        "/absoluteMove",
+        "authorize_device_control",
+        PTZPayloadSpec,
+    ),
+    "relative_move": (
+        "POST",
+        "/relativeMove",
+        "authorize_device_control",
+        PTZPayloadSpec,
+    ),
+    "stream_token": ("POST", "/getToken/videoFeed", "authorize_video_stream", None),
+}
+
+# actions after which the cached status of the camera is stale
+CAMERA_MOVE_ACTIONS = {"goto_preset", "absolute_move", "relative_move"}
+
+PTZ_COMMAND_ID_HEADER = "X-PTZ-Command-Id"
+PTZ_MERGED_COMMANDS_HEADER = "X-PTZ-Merged-Commands"
+PTZ_FORWARDED_ACTION_HEADER = "X-PTZ-Forwarded-Action"
+
+
 class CameraActionsViewSet(GenericViewSet):
     queryset = Device.objects.filter(care_type="camera")
     lookup_field = "external_id"
@@ -34,20 +105,28 @@ class CameraActionsViewSet(GenericViewSet):
             **kwargs,
         }
 
-    def get_gateway_client(self, instance):
+    def get_gateway_device(self, instance):
         metadata = instance.metadata
 
         try:
-            gateway_external_id = metadata["gateway"]
-            gateway_device = Device.objects.get(
-                external_id=gateway_external_id, care_type="gateway"
-            )
+            return get_gateway_device(metadata["gateway"])
         except KeyError as e:
             raise ValidationError({key: "Not configured" for key in e.args}) from e
         except Device.DoesNotExist as e:
             raise ValidationError("Gateway not found") from e
 
-        return GatewayClient(gateway_device)
+    def get_gateway_client(self, instance):
+        return GatewayClient(self.get_gateway_device(instance))
+
+    def get_stream_request_data(self, instance):
+        try:
+            metadata = instance.metadata
+            return {
+                "stream": metadata["stream_id"],
+                "ip": metadata["endpoint_address"],
+            }
+        except KeyError as e:
+            raise ValidationError({key: "Not configured" for key in e.args}) from e
 
     def authorize_video_stream(self, instance):
         if not AuthorizationController.call(
@@ -61,65 +140,323 @@ class CameraActionsViewSet(GenericViewSet):
         ):
             raise PermissionDenied("You do not have permission to control device")
 
+    def get_action_payload(self, action_name, data=None) -> dict | None:
+        """
+        Validates the payload of the action, the request data by default.
+        """
+        payload_spec = GATEWAY_ACTIONS[action_name][3]
+        if payload_spec is None:
+            return None
+        data = self.request.data if data is None else data
+        return payload_spec(**data).model_dump(mode="json")
+
+    def prepare_gateway_action(
+        self, instance, action_name, gateway_device=None, payload=None
+    ):
+        """
+        Authorizes the action on the camera and resolves the gateway call for it,
+        with the already validated `payload` if given.
+
+        Returns a tuple of (gateway device, http method, endpoint, request data).
+        """
+        method, endpoint, authorize, payload_spec = GATEWAY_ACTIONS[action_name]
+        getattr(self, authorize)(instance)
+        gateway_device = gateway_device or self.get_gateway_device(instance)
+        if action_name == "stream_token":
+            request_data = self.get_stream_request_data(instance)
+        elif payload_spec:
+            if payload is None:
+                payload = self.get_action_payload(action_name)
+            request_data = self.get_gateway_request_data(instance, **payload)
+        else:
+            request_data = self.get_gateway_request_data(instance)
+        return gateway_device, method, endpoint, request_data
+
+    def get_camera_status(self, instance, client=None):
+        """
+        Gateway response to the status request of the camera, served from the
+        shared status cache and fetched from the gateway on a miss. The caller
+        is expected to have authorized the request.
+        """
+        method, endpoint, *_ = GATEWAY_ACTIONS["get_status"]
+
+        def fetch():
+            gateway_client = client or self.get_gateway_client(instance)
+            return get_response_entry(
+                gateway_client.request(
+                    method,
+                    endpoint,
+                    self.get_gateway_request_data(instance),
+                    as_http_response=True,
+                )
+            )
+
+        return get_camera_status(instance.external_id, fetch)
+
+    def get_stream_token(self, instance):
+        """
+        Video feed token of the camera stream, shared by all its viewers and
+        fetched from the gateway only when none is cached. The caller is
+        expected to have authorized the request.
+        """
+        method, endpoint, *_ = GATEWAY_ACTIONS["stream_token"]
+        request_data = self.get_stream_request_data(instance)
+
+        def fetch():
+            return get_response_entry(
+                self.get_gateway_client(instance).request(
+                    method, endpoint, request_data, as_http_response=True
+                )
+            )
+
+        return get_stream_token(
+            instance.external_id, request_data["stream"], request_data["ip"], fetch
+        )
+
+    def perform_coalesced_move(
+        self, instance, action_name, gateway_device, method, endpoint, request_data
+    ):
+        """
+        Forwards the move through the PTZ coalescer of the camera. The gateway
+        response of the net command forwarded is passed through, with the ids
+        of the commands merged into it in the `X-PTZ-Merged-Commands` header.
+        """
+        client = GatewayClient(gateway_device)
+        camera_data = {
+            key: value
+            for key, value in request_data.items()
+            if key not in PTZ_COMMAND_FIELDS
+        }
+        result = submit_ptz_command(
+            instance.external_id,
+            action_name,
+            method,
+            endpoint,
+            request_data,
+            lambda method, endpoint, data: get_response_entry(
+                client.request(
+                    method, endpoint, {**camera_data, **data}, as_http_response=True
+                )
+            ),
+            command_id=self.request.headers.get(PTZ_COMMAND_ID_HEADER),
+        )
+        invalidate_camera_status(instance.external_id)
+        response = get_entry_response(result["response"])
+        response[PTZ_COMMAND_ID_HEADER] = result["command"]
+        response[PTZ_MERGED_COMMANDS_HEADER] = ",".join(result["commands"])
+        response[PTZ_FORWARDED_ACTION_HEADER] = result["action"]
+        return response
+
+    def perform_gateway_action(self, action_name):
+        instance = self.get_object()
+        # streamed responses are passed through as they are received, uncached
+        if not gateway_settings.CARE_TELEICU_GATEWAY_STREAM_RESPONSES:
+            if action_name == "get_status":
+                self.authorize_video_stream(instance)
+                return get_entry_response(self.get_camera_status(instance))
+            if action_name == "stream_token":
+                self.authorize_video_stream(instance)
+                return get_entry_response(self.get_stream_token(instance))
+
+        gateway_device, method, endpoint, request_data = self.prepare_gateway_action(
+            instance, action_name
+        )
+        if (
+            action_name in CAMERA_MOVE_ACTIONS
+            and settings.CARE_TELEICU_CAMERA_PTZ_COALESCE
+        ):
+            return self.perform_coalesced_move(
+                instance, action_name, gateway_device, method, endpoint, request_data
+            )
+
+        response = GatewayClient(gateway_device).request(
+            method,
+            endpoint,
+            request_data,
+            as_http_response=True,
+            stream=gateway_settings.CARE_TELEICU_GATEWAY_STREAM_RESPONSES,
+        )
+        if action_name in CAMERA_MOVE_ACTIONS:
+            invalidate_camera_status(instance.external_id)
+        return response
+
     @action(detail=True, methods=["GET"])
     def get_status(self, request, *args, **kwargs):
-        instance = self.get_object()
-        self.authorize_video_stream(instance)
-        gateway_client = self.get_gateway_client(instance)
-        request_data = self.get_gateway_request_data(instance)
-        return gateway_client.get("/status", request_data, as_http_response=True)
+        return self.perform_gateway_action("get_status")
 
     @action(detail=True, methods=["GET"])
     def get_presets(self, request, *args, **kwargs):
-        instance = self.get_object()
-        self.authorize_video_stream(instance)
-        gateway_client = self.get_gateway_client(instance)
-        request_data = self.get_gateway_request_data(instance)
-        return gateway_client.get("/presets", request_data, as_http_response=True)
+        return self.perform_gateway_action("get_presets")
 
     @extend_schema(request=GotoPresetRequestSpec)
     @action(detail=True, methods=["POST"])
     def goto_preset(self, request, *args, **kwargs):
-        instance = self.get_object()
-        self.authorize_device_control(instance)
-        gateway_client = self.get_gateway_client(instance)
-        validated_data = GotoPresetRequestSpec(**request.data).model_dump(mode="json")
-        request_data = self.get_gateway_request_data(instance, **validated_data)
-        return gateway_client.post("/gotoPreset", request_data, as_http_response=True)
+        return self.perform_gateway_action("goto_preset")
 
     @extend_schema(request=PTZPayloadSpec)
     @action(detail=True, methods=["POST"])
     def absolute_move(self, request, *args, **kwargs):
-        instance = self.get_object()
-        self.authorize_device_control(instance)
-        gateway_client = self.get_gateway_client(instance)
-        validated_data = PTZPayloadSpec(**request.data).model_dump(mode="json")
-        request_data = self.get_gateway_request_data(instance, **validated_data)
-        return gateway_client.post("/absoluteMove", request_data, as_http_response=True)
+        return self.perform_gateway_action("absolute_move")
 
     @extend_schema(request=PTZPayloadSpec)
     @action(detail=True, methods=["POST"])
     def relative_move(self, request, *args, **kwargs):
-        instance = self.get_object()
-        self.authorize_device_control(instance)
-        gateway_client = self.get_gateway_client(instance)
-        validated_data = PTZPayloadSpec(**request.data).model_dump(mode="json")
-        request_data = self.get_gateway_request_data(instance, **validated_data)
-        return gateway_client.post("/relativeMove", request_data, as_http_response=True)
+        return self.perform_gateway_action("relative_move")
 
     @action(detail=True, methods=["GET"])
     def stream_token(self, request, *args, **kwargs):
+        return self.perform_gateway_action("stream_token")
+
+    @extend_schema(
+        description="Availability of the gateway the camera is connected through, "
+        "as seen by the gateway circuit breaker."
+    )
+    @action(detail=True, methods=["GET"])
+    def gateway_status(self, request, *args, **kwargs):
         instance = self.get_object()
         self.authorize_video_stream(instance)
-        gateway_client = self.get_gateway_client(instance)
+        gateway_device = self.get_gateway_device(instance)
+        endpoint_address = (gateway_device.metadata or {}).get("endpoint_address")
+        if not endpoint_address:
+            raise ValidationError("Gateway endpoint address not set")
+        return Response(GatewayCircuitBreaker(endpoint_address).as_dict())
+
+    def get_batch_gateway_devices(self, cameras) -> dict[str, Device]:
+        gateway_ids = {
+            camera.metadata["gateway"]
+            for camera in cameras
+            if (camera.metadata or {}).get("gateway")
+        }
+        return {
+            str(gateway.external_id): gateway
+            for gateway in Device.objects.filter(
+                care_type="gateway", external_id__in=gateway_ids
+            )
+        }
+
+    @extend_schema(
+        description="Performs an action on multiple cameras at once. Cameras are "
+        "resolved and authorized in bulk and the gateway calls are made "
+        "concurrently, results and errors are reported per camera.",
+        request=BatchActionRequestSpec,
+        responses={200: BatchActionResponseSpec},
+    )
+    @action(detail=False, methods=["POST"])
+    def batch(self, request, *args, **kwargs):
         try:
-            metadata = instance.metadata
-            request_data = {
-                "stream": metadata["stream_id"],
-                "ip": metadata["endpoint_address"],
-            }
-        except KeyError as e:
-            raise ValidationError({key: "Not configured" for key in e.args}) from e
-        return gateway_client.post(
-            "/getToken/videoFeed", request_data, as_http_response=True
+            batch_request = BatchActionRequestSpec.model_validate(request.data)
+        except PydanticValidationError as e:
+            raise ValidationError(
+                e.errors(include_url=False, include_context=False)
+            ) from e
+        if batch_request.action not in GATEWAY_ACTIONS:
+            raise ValidationError({"action": "Unknown action"})
+        max_cameras = settings.CARE_TELEICU_CAMERA_BATCH_MAX_CAMERAS
+        if len(batch_request.cameras) > max_cameras:
+            raise ValidationError({"cameras": f"At most {max_cameras} cameras"})
+        # the payload is shared by all the cameras, and validated once for them
+        try:
+            payload = self.get_action_payload(batch_request.action, batch_request.data)
+        except PydanticValidationError as e:
+            raise ValidationError(
+                {"data": e.errors(include_url=False, include_context=False)}
+            ) from e
+
+        camera_ids = list(dict.fromkeys(str(c) for c in batch_request.cameras))
+        cameras = {
+            str(camera.external_id): camera
+            for camera in self.get_queryset()
+            .filter(external_id__in=camera_ids)
+            .select_related("current_location")
+        }
+        gateways = self.get_batch_gateway_devices(cameras.values())
+
+        results = {}
+        calls = {}
+        for camera_id in camera_ids:
+            try:
+                camera = cameras.get(camera_id)
+                if camera is None:
+                    raise NotFound("Camera not found")
+                gateway_device = gateways.get((camera.metadata or {}).get("gateway"))
+                if gateway_device is None:
+                    raise ValidationError("Gateway not found")
+                calls[camera_id] = self.prepare_gateway_action(
+                    camera, batch_request.action, gateway_device, payload
+                )
+            except APIException as e:
+                results[camera_id] = self.get_batch_error(camera_id, e)
+
+        # one client per gateway, so that calls to a gateway share its session
+        clients = {}
+        for gateway_device, *_ in calls.values():
+            clients.setdefault(gateway_device.pk, GatewayClient(gateway_device))
+
+        def call(item):
+            camera_id, (gateway_device, method, endpoint, request_data) = item
+            client = clients[gateway_device.pk]
+            try:
+                if batch_request.action == "get_status":
+                    data = get_entry_data(
+                        get_camera_status(
+                            camera_id,
+                            lambda: get_response_entry(
+                                client.request(
+                                    method,
+                                    endpoint,
+                                    request_data,
+                                    as_http_response=True,
+                                )
+                            ),
+                        )
+                    )
+                elif batch_request.action == "stream_token":
+                    data = get_entry_data(
+                        get_stream_token(
+                            camera_id,
+                            request_data["stream"],
+                            request_data["ip"],
+                            lambda: get_response_entry(
+                                client.request(
+                                    method,
+                                    endpoint,
+                                    request_data,
+                                    as_http_response=True,
+                                )
+                            ),
+                        )
+                    )
+                else:
+                    data = client.request(method, endpoint, request_data)
+                    if batch_request.action in CAMERA_MOVE_ACTIONS:
+                        invalidate_camera_status(camera_id)
+                return BatchActionResultSpec(camera=camera_id, status=200, data=data)
+            except APIException as e:
+                return self.get_batch_error(camera_id, e)
+            except Exception:
+                # a camera failing unexpectedly must not fail the rest
+                logger.exception(
+                    "Batch %s failed for camera %s", batch_request.action, camera_id
+                )
+                return BatchActionResultSpec(
+                    camera=camera_id, status=500, error="Internal server error"
+                )
+
+        if calls:
+            concurrency = min(
+                len(calls), settings.CARE_TELEICU_CAMERA_BATCH_CONCURRENCY
+            )
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                for result in executor.map(call, calls.items()):
+                    results[result.camera] = result
+
+        return Response(
+            BatchActionResponseSpec(
+                [results[camera_id] for camera_id in camera_ids]
+            ).model_dump(mode="json", exclude_none=True)
+        )
+
+    def get_batch_error(self, camera_id, exc: APIException) -> BatchActionResultSpec:
+        return BatchActionResultSpec(
+            camera=camera_id, status=exc.status_code, error=exc.detail
         )
@@ -0,0 +1,202 @@
+from asgiref.sync import sync_to_async
+from django.http import HttpResponseNotAllowed
+from django.urls import path
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+
+from camera_device.gateway_responses import get_entry_response, get_response_entry
+from camera_device.settings import plugin_settings as camera_settings
+from camera_device.status_cache import aget_camera_status, ainvalidate_camera_status
+from camera_device.stream_tokens import get_cached_stream_token, store_stream_token
+from camera_device.viewsets.actions import (
+    CAMERA_MOVE_ACTIONS,
+    GATEWAY_ACTIONS,
+    CameraActionsViewSet,
+)
+from gateway_device.async_client import AsyncGatewayClient
+from gateway_device.client import GatewayClient
+from gateway_device.settings import plugin_settings as gateway_settings
+
+
+def _render_exception(viewset, exc):
+    response = viewset.handle_exception(exc)
+    response = viewset.finalize_response(viewset.request, response)
+    return response.render()
+
+
+class AsyncCameraActionView(View):
+    """
+    ASGI-capable counterpart of the `CameraActionsViewSet` actions.
+
+    Authentication, permission checks and the camera / gateway lookups are run
+    through `CameraActionsViewSet` in a worker thread, while the gateway round
+    trip is awaited on the event loop.
+    """
+
+    action_name = None
+    http_method_names = ["get", "post"]
+
+    def get_allowed_methods(self):
+        return list(getattr(CameraActionsViewSet, self.action_name).mapping)
+
+    def get_viewset(self, request, external_id):
+        viewset = CameraActionsViewSet(
+            action_map={request.method.lower(): self.action_name},
+            args=(),
+            kwargs={"external_id": external_id},
+            format_kwarg=None,
+        )
+        viewset.request = viewset.initialize_request(request)
+        viewset.headers = viewset.default_response_headers
+        return viewset
+
+    def is_cached_status(self) -> bool:
+        # streamed statuses are passed through as they are received, uncached
+        return (
+            self.action_name == "get_status"
+            and not gateway_settings.CARE_TELEICU_GATEWAY_STREAM_RESPONSES
+        )
+
+    def prepare(self, viewset):
+        try:
+            viewset.initial(viewset.request)
+            instance = viewset.get_object()
+            if self.is_cached_status():
+                # the gateway is only looked up on a miss of the status cache
+                viewset.authorize_video_stream(instance)
+                return (instance,), None
+            gateway_device, *prepared = viewset.prepare_gateway_action(
+                instance, self.action_name
+            )
+            client = AsyncGatewayClient(gateway_device)
+            return (instance, client, gateway_device, *prepared), None
+        except Exception as exc:
+            return None, _render_exception(viewset, exc)
+
+    async def get_status(self, viewset, instance):
+        method, endpoint, *_ = GATEWAY_ACTIONS["get_status"]
+
+        async def fetch():
+            gateway_device, request_data = await sync_to_async(
+                lambda: (
+                    viewset.get_gateway_device(instance),
+                    viewset.get_gateway_request_data(instance),
+                )
+            )()
+            return get_response_entry(
+                await AsyncGatewayClient(gateway_device).request(
+                    method, endpoint, request_data, as_http_response=True
+                )
+            )
+
+        try:
+            entry = await aget_camera_status(instance.external_id, fetch)
+        except APIException as exc:
+            return await sync_to_async(_render_exception)(viewset, exc)
+        return get_entry_response(entry)
+
+    async def handle(self, request, external_id):
+        allowed_methods = self.get_allowed_methods()
+        if request.method.lower() not in allowed_methods:
+            return HttpResponseNotAllowed([m.upper() for m in allowed_methods])
+
+        viewset = self.get_viewset(request, external_id)
+        prepared, error_response = await sync_to_async(self.prepare)(viewset)
+        if error_response is not None:
+            return error_response
+        if self.is_cached_status():
+            return await self.get_status(viewset, *prepared)
+        instance, client, gateway_device, method, endpoint, request_data = prepared
+        camera_external_id = instance.external_id
+
+        if (
+            self.action_name in CAMERA_MOVE_ACTIONS
+            and camera_settings.CARE_TELEICU_CAMERA_PTZ_COALESCE
+        ):
+            # the coalescer waits on the cache, so it runs in a thread of its
+            # own rather than on the event loop
+            try:
+                return await sync_to_async(
+                    viewset.perform_coalesced_move, thread_sensitive=False
+                )(
+                    instance,
+                    self.action_name,
+                    gateway_device,
+                    method,
+                    endpoint,
+                    request_data,
+                )
+            except APIException as exc:
+                return await sync_to_async(_render_exception)(viewset, exc)
+
+        try:
+            if (
+                self.action_name == "stream_token"
+                and not gateway_settings.CARE_TELEICU_GATEWAY_STREAM_RESPONSES
+            ):
+                return get_entry_response(
+                    await self.get_stream_token(
+                        camera_external_id,
+                        gateway_device,
+                        client,
+                        method,
+                        endpoint,
+                        request_data,
+                    )
+                )
+
+            response = await client.request(
+                method,
+                endpoint,
+                request_data,
+                as_http_response=True,
+                stream=gateway_settings.CARE_TELEICU_GATEWAY_STREAM_RESPONSES,
+            )
+        except APIException as exc:
+            return await sync_to_async(_render_exception)(viewset, exc)
+        if self.action_name in CAMERA_MOVE_ACTIONS:
+            await ainvalidate_camera_status(camera_external_id)
+        return response
+
+    async def get_stream_token(
+        self, camera_external_id, gateway_device, client, method, endpoint, data
+    ):
+        stream_id = data["stream"]
+        endpoint_address = data["ip"]
+        response = await sync_to_async(get_cached_stream_token)(
+            camera_external_id,
+            stream_id,
+            endpoint_address,
+            # the background refresh runs in a thread of its own
+            lambda: get_response_entry(
+                GatewayClient(gateway_device).request(
+                    method, endpoint, data, as_http_response=True
+                )
+            ),
+        )
+        if response is None:
+            response = get_response_entry(
+                await client.request(method, endpoint, data, as_http_response=True)
+            )
+            await sync_to_async(store_stream_token)(
+                camera_external_id, stream_id, endpoint_address, response
+            )
+        return response
+
+    async def get(self, request, external_id, *args, **kwargs):
+        return await self.handle(request, external_id)
+
+    async def post(self, request, external_id, *args, **kwargs):
+        return await self.handle(request, external_id)
+
+
+def get_async_action_urls(prefix: str = "async_actions"):
+    return [
+        path(
+            f"{prefix}/<str:external_id>/{action_name}/",
+            csrf_exempt(AsyncCameraActionView.as_view(action_name=action_name)),
+            name=f"camera-async-actions-{action_name.replace('_', '-')}",
+        )
+        for action_name in GATEWAY_ACTIONS
+    ]
@@ -13,6 +13,7 @@ class GatewayDeviceConfig(AppConfig):
         Import models, signals, and other dependencies here to ensure
         Django's app registry is fully initialized before use.
         """
+        import gateway_device.signals  # noqa
         from care.emr.registries.device_type.device_registry import DeviceTypeRegistry
         from gateway_device.device import GatewayDevice
 
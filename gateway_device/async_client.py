@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import time
+import weakref
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.http import HttpResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from gateway_device.client import GatewayAPIException, GatewayClient
+from gateway_device.settings import plugin_settings as settings
+
+logger = logging.getLogger(__name__)
+
+
+# httpx.AsyncClient instances are bound to the event loop they were first used
+# in, hence the clients are pooled per event loop and per gateway.
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, httpx.AsyncClient]]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_async_http_client(base_url: str) -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    clients = _loop_clients.setdefault(loop, {})
+    client = clients.get(base_url)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=settings.CARE_TELEICU_GATEWAY_POOL_MAXSIZE,
+                max_keepalive_connections=settings.CARE_TELEICU_GATEWAY_POOL_MAXSIZE,
+                keepalive_expiry=settings.CARE_TELEICU_GATEWAY_POOL_IDLE_TIMEOUT
+                or None,
+            ),
+        )
+        clients[base_url] = client
+    return client
+
+
+def run_in_thread(func, *args):
+    """
+    Runs the cache bound (and token signing) steps of a call in a worker
+    thread, so that their round trips do not block the event loop.
+    """
+    return sync_to_async(func, thread_sensitive=False)(*args)
+
+
+class AsyncGatewayClient(GatewayClient):
+    """
+    asyncio counterpart of `GatewayClient`, intended to be used from async
+    views so that in-flight gateway calls do not hold a worker thread.
+    """
+
+    def _before_request(self, endpoint) -> tuple[bool, float]:
+        return self._check_circuit(), self.get_timeout(endpoint)
+
+    def _after_response(self, response_status, has_failures, endpoint, duration):
+        self._record_response(response_status, has_failures)
+        self.record_latency(endpoint, duration)
+
+    def _after_failure(self, endpoint=None, timed_out=False):
+        self.circuit_breaker.record_failure()
+        if timed_out:
+            self.record_timeout(endpoint)
+
+    async def _aiter_streamed_content(self, response):
+        max_size = settings.CARE_TELEICU_GATEWAY_STREAM_MAX_SIZE
+        received = 0
+        try:
+            async for chunk in response.aiter_bytes(
+                settings.CARE_TELEICU_GATEWAY_STREAM_CHUNK_SIZE
+            ):
+                received += len(chunk)
+                if max_size and received > max_size:
+                    self._abort_stream(f"Gateway response exceeded {max_size} bytes")
+                yield chunk
+        except httpx.HTTPError as e:
+            self._abort_stream(f"Gateway connection error while streaming: {str(e)}")
+        finally:
+            await response.aclose()
+
+    async def _get_streaming_http_response(self, response) -> StreamingHttpResponse:
+        try:
+            self._check_response_size(response.headers.get("content-length"))
+        except APIException:
+            await response.aclose()
+            raise
+        return StreamingHttpResponse(
+            self._aiter_streamed_content(response),
+            content_type=response.headers.get("content-type", "application/json"),
+            status=response.status_code,
+        )
+
+    async def _make_request(
+        self,
+        method: str,
+        url: str,
+        as_http_response=False,
+        stream=False,
+        endpoint=None,
+        **request_kwargs,
+    ) -> HttpResponse | StreamingHttpResponse | dict:
+        """
+        Execute the HTTP request and validate the response.
+
+        Refer `GatewayClient._make_request` for the arguments, return value and
+        the mapping of failures to API exceptions.
+        """
+        has_failures, timeout = await run_in_thread(self._before_request, endpoint)
+        started_at = time.monotonic()
+        try:
+            client = get_async_http_client(self.base_url)
+            if stream and as_http_response:
+                response = await client.send(
+                    client.build_request(
+                        method, url, timeout=timeout, **request_kwargs
+                    ),
+                    stream=True,
+                )
+                await run_in_thread(
+                    self._after_response,
+                    response.status_code,
+                    has_failures,
+                    endpoint,
+                    time.monotonic() - started_at,
+                )
+                return await self._get_streaming_http_response(response)
+
+            response = await client.request(
+                method, url, timeout=timeout, **request_kwargs
+            )
+            await run_in_thread(
+                self._after_response,
+                response.status_code,
+                has_failures,
+                endpoint,
+                time.monotonic() - started_at,
+            )
+
+            # Handle response based on format requested
+            if as_http_response:
+                return HttpResponse(
+                    response.content,
+                    content_type=response.headers.get(
+                        "content-type", "application/json"
+                    ),
+                    status=response.status_code,
+                )
+
+            if response.status_code >= status.HTTP_400_BAD_REQUEST:
+                raise GatewayAPIException(response.text, response.status_code)
+
+            return response.json()
+
+        except APIException:
+            raise
+        except httpx.TimeoutException as e:
+            await run_in_thread(self._after_failure, endpoint, True)
+            raise GatewayAPIException(
+                {"error": f"Request timed out after {timeout} seconds"},
+                status.HTTP_504_GATEWAY_TIMEOUT,
+            ) from e
+        except httpx.HTTPError as e:
+            if isinstance(e, httpx.TransportError):
+                await run_in_thread(self._after_failure)
+            logger.error(f"Gateway connection error: {str(e)}")
+            raise GatewayAPIException(
+                {"error": "Failed to connect to gateway device"},
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+            ) from e
+        except json.decoder.JSONDecodeError as e:
+            raise GatewayAPIException(
+                {"error": "Invalid JSON response from gateway device"},
+                status.HTTP_502_BAD_GATEWAY,
+            ) from e
+        except Exception as e:
+            logger.error(f"Unexpected error during gateway request: {str(e)}")
+            raise GatewayAPIException(
+                {"error": "An unexpected error occurred during gateway request"},
+                status.HTTP_500_INTERNAL_SERVER_ERROR,
+            ) from e
+
+    async def request(
+        self, method, endpoint, data=None, as_http_response=False, stream=False
+    ):
+        url = self._get_url(endpoint)
+        return await self._make_request(
+            method,
+            url,
+            as_http_response=as_http_response,
+            stream=stream,
+            headers=await run_in_thread(self._get_headers),
+            endpoint=endpoint,
+            **self._get_request_kwargs(method, data),
+        )
+
+    async def get(self, endpoint, data=None, as_http_response=False, stream=False):
+        return await self.request(
+            "GET", endpoint, data, as_http_response=as_http_response, stream=stream
+        )
+
+    async def post(self, endpoint, data=None, as_http_response=False, stream=False):
+        return await self.request(
+            "POST", endpoint, data, as_http_response=as_http_response, stream=stream
+        )
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
+from django.core.cache import cache
+
+from care.emr.models import Device
+from care.users.models import User
+from gateway_device.settings import plugin_settings as settings
+
+VERIFIED_TOKEN_MAX_TTL = 60 * 5
+MAX_PARSED_KEYS = 256
+GATEWAY_DEVICE_CACHE_TTL = 60 * 5
+SERVICE_USER_CACHE_TTL = 60 * 60
+
+
+def gateway_device_cache_key(external_id) -> str:
+    return f"gateway_device:{external_id}"
+
+
+def service_user_cache_key(username: str) -> str:
+    return f"gateway_service_user:{username}"
+
+
+def get_gateway_device(external_id):
+    """
+    Returns the gateway device with the given external id, served from the
+    cache when possible. Raises `Device.DoesNotExist` (or `ValidationError`
+    for malformed ids) like `Device.objects.get` would.
+    """
+    cache_key = gateway_device_cache_key(external_id)
+    gateway = cache.get(cache_key)
+    if gateway is None:
+        gateway = Device.objects.get(external_id=external_id, care_type="gateway")
+        cache.set(cache_key, gateway, timeout=GATEWAY_DEVICE_CACHE_TTL)
+    return gateway
+
+
+def get_service_user(username: str, defaults: dict):
+    """
+    Returns the service user with the given username, creating it with the
+    given defaults if it does not exist yet.
+    """
+    cache_key = service_user_cache_key(username)
+    user = cache.get(cache_key)
+    if user is None:
+        user, _ = User.objects.get_or_create(username=username, defaults=defaults)
+        cache.set(cache_key, user, timeout=SERVICE_USER_CACHE_TTL)
+    return user
+
+
+def token_digest(url: str, token: bytes | str) -> str:
+    if isinstance(token, str):
+        token = token.encode()
+    return hashlib.sha256(url.encode() + b"\0" + token).hexdigest()
+
+
+class PublicKeyCache:
+    """
+    In-process cache of parsed gateway public keys, indexed by the openid url
+    and the key id, so that `RSAAlgorithm.from_jwk` runs once per key instead
+    of once per request.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._keys: dict[tuple[str, str | None, str], object] = {}
+
+    def get(self, url: str, jwk: dict):
+        # the serialized jwk is a part of the key so that rotated keys reusing
+        # a kid are never served stale
+        key = (url, jwk.get("kid"), json.dumps(jwk, sort_keys=True))
+        public_key = self._keys.get(key)
+        if public_key is None:
+            public_key = jwt.algorithms.RSAAlgorithm.from_jwk(jwk)
+            with self._lock:
+                if len(self._keys) >= MAX_PARSED_KEYS:
+                    self._keys.clear()
+                self._keys[key] = public_key
+        return public_key
+
+    def clear(self):
+        with self._lock:
+            self._keys.clear()
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of token digests that have already been verified, valid until
+    the token's expiry, along with a short lived record of tokens that failed
+    verification.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._verified: OrderedDict[str, tuple[dict, float]] = OrderedDict()
+        self._rejected: OrderedDict[str, float] = OrderedDict()
+
+    def get(self, digest: str) -> dict | None:
+        with self._lock:
+            entry = self._verified.get(digest)
+            if entry is None:
+                return None
+            claims, expires_at = entry
+            if expires_at <= time.time():
+                del self._verified[digest]
+                return None
+            self._verified.move_to_end(digest)
+            return claims
+
+    def set(self, digest: str, claims: dict):
+        expires_at = time.time() + VERIFIED_TOKEN_MAX_TTL
+        if isinstance(claims.get("exp"), int | float):
+            expires_at = min(expires_at, claims["exp"])
+        max_size = settings.CARE_TELEICU_GATEWAY_TOKEN_CACHE_SIZE
+        with self._lock:
+            self._verified[digest] = (claims, expires_at)
+            self._verified.move_to_end(digest)
+            while len(self._verified) > max_size:
+                self._verified.popitem(last=False)
+
+    def is_rejected(self, digest: str) -> bool:
+        with self._lock:
+            expires_at = self._rejected.get(digest)
+            if expires_at is None:
+                return False
+            if expires_at <= time.time():
+                del self._rejected[digest]
+                return False
+            return True
+
+    def reject(self, digest: str):
+        expires_at = time.time() + settings.CARE_TELEICU_GATEWAY_INVALID_TOKEN_CACHE_TTL
+        max_size = settings.CARE_TELEICU_GATEWAY_TOKEN_CACHE_SIZE
+        with self._lock:
+            self._rejected[digest] = expires_at
+            self._rejected.move_to_end(digest)
+            while len(self._rejected) > max_size:
+                self._rejected.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._verified.clear()
+            self._rejected.clear()
+
+
+public_key_cache = PublicKeyCache()
+verified_token_cache = VerifiedTokenCache()
@@ -1,4 +1,7 @@
 import logging
+import threading
+import time
+from concurrent.futures import Future
 
 import jwt
 import requests
@@ -12,18 +15,146 @@ from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidTok
 from rest_framework_simplejwt.tokens import Token
 
 from care.emr.models import Device
-from care.users.models import User
+from gateway_device.auth_cache import (
+    get_gateway_device,
+    get_service_user,
+    public_key_cache,
+    token_digest,
+    verified_token_cache,
+)
+from gateway_device.settings import plugin_settings as settings
 
 logger = logging.getLogger(__name__)
 
 
 OPENID_REQUEST_TIMEOUT = 5
+# minimum age of the key set before a kid that is not part of it triggers a refetch
+JWKS_UNKNOWN_KID_REFETCH_AGE = 30
+
+_cold_fetches: dict[str, Future] = {}
+_cold_fetches_lock = threading.Lock()
+
+
+def is_permanent_token_error(error: jwt.InvalidTokenError) -> bool:
+    """
+    Whether the token would fail verification again, as opposed to failures
+    from clock skew (nbf / iat) or from a key set that does not include the
+    signing key yet, which are never remembered.
+    """
+    if isinstance(error, jwt.InvalidSignatureError):
+        return False
+    return isinstance(error, (jwt.DecodeError, jwt.ExpiredSignatureError))
 
 
 def jwk_response_cache_key(url: str) -> str:
     return f"jwk_response:{url}"
 
 
+def jwk_refresh_lock_cache_key(url: str) -> str:
+    return f"jwk_response_lock:{url}"
+
+
+def fetch_public_keys(url: str) -> dict:
+    res = requests.get(url, timeout=OPENID_REQUEST_TIMEOUT)
+    res.raise_for_status()
+    entry = {"keys": res.json()["keys"], "fetched_at": time.time()}
+    cache.set(
+        jwk_response_cache_key(url),
+        entry,
+        timeout=settings.CARE_TELEICU_GATEWAY_JWKS_CACHE_TTL
+        + settings.CARE_TELEICU_GATEWAY_JWKS_STALE_GRACE,
+    )
+    return entry
+
+
+def acquire_refresh_lock(url: str) -> bool:
+    return cache.add(
+        jwk_refresh_lock_cache_key(url), 1, timeout=OPENID_REQUEST_TIMEOUT * 2
+    )
+
+
+def refresh_public_keys(url: str, fallback: dict | None = None) -> dict:
+    """
+    Refetches the key set of the gateway, for the caller holding the refresh
+    lock. Returns `fallback` if the fetch fails and a fallback is available.
+    """
+    try:
+        entry = fetch_public_keys(url)
+    except (requests.RequestException, ValueError, KeyError) as e:
+        # the lock is left to expire on its own, backing off further attempts
+        if fallback is None:
+            raise
+        logger.warning("Failed to refresh gateway keys from %s: %s", url, e)
+        return fallback
+    cache.delete(jwk_refresh_lock_cache_key(url))
+    return entry
+
+
+def refresh_public_keys_in_background(url: str, fallback: dict):
+    if acquire_refresh_lock(url):
+        threading.Thread(
+            target=refresh_public_keys, args=(url, fallback), daemon=True
+        ).start()
+
+
+def fetch_public_keys_once(url: str) -> dict:
+    """
+    Fetches the key set of a gateway that has none cached, sharing a single
+    fetch between the concurrent requests of the worker.
+    """
+    with _cold_fetches_lock:
+        future = _cold_fetches.get(url)
+        leader = future is None
+        if leader:
+            future = _cold_fetches[url] = Future()
+    if not leader:
+        return future.result()
+
+    try:
+        entry = fetch_public_keys(url)
+        future.set_result(entry)
+        return entry
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _cold_fetches_lock:
+            _cold_fetches.pop(url, None)
+
+
+def get_public_keys(url: str, force_refresh: bool = False) -> dict:
+    """
+    Returns the cached key set of the gateway, refreshing it at most once
+    across all workers at a time.
+
+    Fresh entries are served as is, entries nearing expiry are served while
+    being refreshed in the background, and expired entries are served to
+    everyone but the worker refreshing them, which also covers failed
+    refreshes within the stale grace window. Without a cached entry, each
+    worker fetches the key set once for all of its requests.
+    """
+    entry = cache.get(jwk_response_cache_key(url))
+    if entry and "fetched_at" not in entry:
+        # key set cached in the older format, treat it as expired
+        entry = {"keys": entry["keys"], "fetched_at": 0}
+
+    if entry is None:
+        return fetch_public_keys_once(url)
+
+    age = time.time() - entry["fetched_at"]
+    ttl = settings.CARE_TELEICU_GATEWAY_JWKS_CACHE_TTL
+    if force_refresh or age >= ttl:
+        if not acquire_refresh_lock(url):
+            # another worker is refreshing the key set, serve the stale one
+            return entry
+        if age >= ttl + settings.CARE_TELEICU_GATEWAY_JWKS_STALE_GRACE:
+            return refresh_public_keys(url)
+        return refresh_public_keys(url, fallback=entry)
+    if age >= ttl - settings.CARE_TELEICU_GATEWAY_JWKS_REFRESH_AHEAD:
+        refresh_public_keys_in_background(url, entry)
+    return entry
+
+
 class GatewayAuthentication(JWTAuthentication):
     """
     An authentication plugin that authenticates requests through a JSON web
@@ -34,26 +165,48 @@ class GatewayAuthentication(JWTAuthentication):
     auth_header_type = "Gateway_Bearer"
     auth_header_type_bytes = auth_header_type.encode(HTTP_HEADER_ENCODING)
 
-    def get_public_key(self, url):
-        public_key_json = cache.get(jwk_response_cache_key(url))
-        if not public_key_json:
-            res = requests.get(url, timeout=OPENID_REQUEST_TIMEOUT)
-            res.raise_for_status()
-            public_key_json = res.json()
-            cache.set(jwk_response_cache_key(url), public_key_json, timeout=60 * 5)
+    def get_public_key(self, url, kid=None):
+        public_key_json = get_public_keys(url)
+        if kid is None:
+            return public_key_json["keys"][0]
+        if (
+            not any(key.get("kid") == kid for key in public_key_json["keys"])
+            and time.time() - public_key_json["fetched_at"]
+            > JWKS_UNKNOWN_KID_REFETCH_AGE
+        ):
+            # the gateway may have rotated its keys
+            public_key_json = get_public_keys(url, force_refresh=True)
+        for key in public_key_json["keys"]:
+            if key.get("kid") == kid:
+                return key
         return public_key_json["keys"][0]
 
     def open_id_authenticate(self, url, token):
-        public_key_response = self.get_public_key(url)
-        public_key = jwt.algorithms.RSAAlgorithm.from_jwk(public_key_response)
-        return jwt.decode(token, key=public_key, algorithms=["RS256"])
+        digest = token_digest(url, token)
+        if claims := verified_token_cache.get(digest):
+            return claims
+        if verified_token_cache.is_rejected(digest):
+            raise jwt.InvalidTokenError("Token was previously rejected")
+
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+            public_key_response = self.get_public_key(url, kid)
+            public_key = public_key_cache.get(url, public_key_response)
+            claims = jwt.decode(token, key=public_key, algorithms=["RS256"])
+        except jwt.InvalidTokenError as e:
+            if is_permanent_token_error(e):
+                verified_token_cache.reject(digest)
+            raise
+
+        verified_token_cache.set(digest, claims)
+        return claims
 
     def authenticate_header(self, request):
         return f'{self.auth_header_type} realm="{self.www_authenticate_realm}"'
 
     def get_user(self, _: Token):
-        user, _ = User.objects.get_or_create(
-            username="teleicu-gateway",
+        return get_service_user(
+            "teleicu-gateway",
             defaults={
                 "first_name": "TeleICU",
                 "last_name": "Gateway",
@@ -63,7 +216,6 @@ class GatewayAuthentication(JWTAuthentication):
                 "is_active": False,
             },
         )
-        return user
 
     def authenticate(self, request):
         header = self.get_header(request)
@@ -77,7 +229,7 @@ class GatewayAuthentication(JWTAuthentication):
         external_id = request.headers[self.gateway_header]
 
         try:
-            gateway = Device.objects.get(external_id=external_id, care_type="gateway")
+            gateway = get_gateway_device(external_id)
         except (Device.DoesNotExist, ValidationError) as e:
             raise InvalidToken(
                 {"detail": "Invalid Gateway Device", "messages": []}
@@ -0,0 +1,115 @@
+import enum
+import time
+
+from django.core.cache import cache
+
+from gateway_device.settings import plugin_settings as settings
+
+
+class CircuitState(enum.Enum):
+    closed = "closed"
+    open = "open"
+    half_open = "half_open"
+
+
+def circuit_failures_cache_key(gateway_host: str) -> str:
+    return f"gateway_circuit:failures:{gateway_host}"
+
+
+def circuit_opened_at_cache_key(gateway_host: str) -> str:
+    return f"gateway_circuit:opened_at:{gateway_host}"
+
+
+def circuit_probe_cache_key(gateway_host: str) -> str:
+    return f"gateway_circuit:probe:{gateway_host}"
+
+
+class GatewayCircuitBreaker:
+    """
+    Per-gateway circuit breaker whose state is kept in the Django cache so
+    that it is shared across all workers.
+
+    The circuit opens after `CARE_TELEICU_GATEWAY_CIRCUIT_FAILURE_THRESHOLD`
+    consecutive connection failures or timeouts and rejects requests while
+    open. Once `CARE_TELEICU_GATEWAY_CIRCUIT_RESET_TIMEOUT` seconds have
+    elapsed the circuit is half-open and a single trial request is let through;
+    its outcome either closes the circuit or opens it again.
+    """
+
+    def __init__(self, gateway_host: str):
+        self.gateway_host = gateway_host
+        self.failures_key = circuit_failures_cache_key(gateway_host)
+        self.opened_at_key = circuit_opened_at_cache_key(gateway_host)
+        self.probe_key = circuit_probe_cache_key(gateway_host)
+
+    @property
+    def enabled(self) -> bool:
+        return settings.CARE_TELEICU_GATEWAY_CIRCUIT_BREAKER_ENABLED
+
+    def _get_state(self, opened_at) -> CircuitState:
+        if opened_at is None:
+            return CircuitState.closed
+        if time.time() - opened_at < settings.CARE_TELEICU_GATEWAY_CIRCUIT_RESET_TIMEOUT:
+            return CircuitState.open
+        return CircuitState.half_open
+
+    @property
+    def state(self) -> CircuitState:
+        if not self.enabled:
+            return CircuitState.closed
+        return self._get_state(cache.get(self.opened_at_key))
+
+    def allow_request(self) -> tuple[bool, bool]:
+        """
+        Returns whether a request may go through to the gateway, and whether
+        the circuit has failures recorded that a successful request resets.
+        The latter is handed back to `record_success` by the caller, as the
+        breaker may be shared by concurrent requests.
+        """
+        if not self.enabled:
+            return True, False
+        values = cache.get_many([self.failures_key, self.opened_at_key])
+        has_failures = bool(values)
+        state = self._get_state(values.get(self.opened_at_key))
+        if state == CircuitState.closed:
+            return True, has_failures
+        if state == CircuitState.open:
+            return False, has_failures
+        # only one of the concurrent callers gets to probe the gateway
+        allowed = cache.add(
+            self.probe_key, 1, timeout=settings.CARE_TELEICU_GATEWAY_API_TIMEOUT
+        )
+        return allowed, has_failures
+
+    def record_success(self, has_failures: bool = True):
+        # skipping the reset while the gateway is healthy saves a cache round
+        # trip per request
+        if not self.enabled or not has_failures:
+            return
+        cache.delete_many([self.failures_key, self.opened_at_key, self.probe_key])
+
+    def record_failure(self):
+        if not self.enabled:
+            return
+        reset_timeout = settings.CARE_TELEICU_GATEWAY_CIRCUIT_RESET_TIMEOUT
+        cache.add(self.failures_key, 0, timeout=reset_timeout * 10)
+        try:
+            failures = cache.incr(self.failures_key)
+        except ValueError:
+            # key got evicted in between
+            failures = 1
+            cache.set(self.failures_key, failures, timeout=reset_timeout * 10)
+
+        if (
+            failures >= settings.CARE_TELEICU_GATEWAY_CIRCUIT_FAILURE_THRESHOLD
+            or cache.get(self.probe_key) is not None
+        ):
+            cache.set(self.opened_at_key, time.time(), timeout=None)
+            cache.delete(self.probe_key)
+
+    def as_dict(self) -> dict:
+        return {
+            "state": self.state.value,
+            "failures": cache.get(self.failures_key, 0),
+            "opened_at": cache.get(self.opened_at_key),
+        }
@@ -1,11 +1,15 @@
 import json
 import logging
+import time
 
 import requests
 from django.conf import settings as django_settings
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from gateway_device.circuit_breaker import GatewayCircuitBreaker
+from gateway_device.latency import latency_tracker
+from gateway_device.sessions import session_pool
 from gateway_device.settings import plugin_settings as settings
-from gateway_device.token_generator import generate_jwt
+from gateway_device.token_generator import get_cached_jwt
 from rest_framework import status
 from rest_framework.exceptions import APIException, ValidationError
 
@@ -14,6 +18,12 @@ from care.emr.models.device import Device
 logger = logging.getLogger(__name__)
 
 
+class GatewayAPIException(APIException):
+    def __init__(self, detail, status_code):
+        super().__init__(detail)
+        self.status_code = status_code
+
+
 class GatewayClient:
     auth_header_type = "Care_Bearer"
 
@@ -26,20 +36,116 @@ class GatewayClient:
         self.insecure = gateway.metadata.get("insecure", False)
         if django_settings.IS_PRODUCTION:
             self.insecure = False
+        self.circuit_breaker = GatewayCircuitBreaker(self.gateway_host)
 
-    def _get_url(self, endpoint):
+    @property
+    def base_url(self):
         protocol = "http" if self.insecure else "https"
-        return f"{protocol}://{self.gateway_host}{endpoint}"
+        return f"{protocol}://{self.gateway_host}"
+
+    def _get_url(self, endpoint):
+        return f"{self.base_url}{endpoint}"
+
+    def _get_claims(self):
+        if settings.CARE_TELEICU_GATEWAY_JWT_AUDIENCE:
+            return {"aud": self.gateway_host}
+        return None
 
     def _get_headers(self):
         return {
-            "Authorization": f"{self.auth_header_type} {generate_jwt()}",
+            "Authorization": f"{self.auth_header_type} {get_cached_jwt(self._get_claims())}",
             "Accept": "application/json",
         }
 
+    def get_timeout(self, endpoint=None):
+        if endpoint is None:
+            return self.timeout
+        return latency_tracker.get_timeout(self.gateway_host, endpoint)
+
+    def record_latency(self, endpoint, duration):
+        if endpoint is not None:
+            latency_tracker.record(self.gateway_host, endpoint, duration)
+
+    def record_timeout(self, endpoint):
+        if endpoint is not None:
+            latency_tracker.record_timeout(self.gateway_host, endpoint)
+
+    def _check_circuit(self) -> bool:
+        allowed, has_failures = self.circuit_breaker.allow_request()
+        if not allowed:
+            raise GatewayAPIException(
+                {"error": "Gateway device is unavailable"},
+                status.HTTP_503_SERVICE_UNAVAILABLE,
+            )
+        return has_failures
+
+    def _record_response(self, response_status, has_failures):
+        # a 5xx from the gateway does not prove it healthy, so it neither
+        # closes the circuit nor resets the failures counted so far
+        if response_status < status.HTTP_500_INTERNAL_SERVER_ERROR:
+            self.circuit_breaker.record_success(has_failures)
+
+    def _check_response_size(self, content_length):
+        max_size = settings.CARE_TELEICU_GATEWAY_STREAM_MAX_SIZE
+        if not max_size or content_length is None:
+            return
+        try:
+            content_length = int(content_length)
+        except ValueError:
+            raise GatewayAPIException(
+                {"error": "Invalid Content-Length in gateway device response"},
+                status.HTTP_502_BAD_GATEWAY,
+            )
+        if content_length > max_size:
+            raise GatewayAPIException(
+                {"error": "Response from gateway device is too large"},
+                status.HTTP_502_BAD_GATEWAY,
+            )
+
+    def _abort_stream(self, message):
+        # the status line is already sent, so the only way to tell the client
+        # that the body is incomplete is to abort the connection, which the
+        # server does when the response iterator raises
+        logger.error(message)
+        raise GatewayAPIException({"error": message}, status.HTTP_502_BAD_GATEWAY)
+
+    def _iter_streamed_content(self, response):
+        max_size = settings.CARE_TELEICU_GATEWAY_STREAM_MAX_SIZE
+        received = 0
+        try:
+            for chunk in response.iter_content(
+                chunk_size=settings.CARE_TELEICU_GATEWAY_STREAM_CHUNK_SIZE
+            ):
+                received += len(chunk)
+                if max_size and received > max_size:
+                    self._abort_stream(f"Gateway response exceeded {max_size} bytes")
+                yield chunk
+        except requests.RequestException as e:
+            self._abort_stream(f"Gateway connection error while streaming: {str(e)}")
+        finally:
+            response.close()
+
+    def _get_streaming_http_response(self, response) -> StreamingHttpResponse:
+        try:
+            self._check_response_size(response.headers.get("content-length"))
+        except APIException:
+            response.close()
+            raise
+        return StreamingHttpResponse(
+            self._iter_streamed_content(response),
+            content_type=response.headers.get("content-type", "application/json"),
+            status=response.status_code,
+        )
+
     def _make_request(
-        self, method: str, url: str, as_http_response=False, **request_kwargs
-    ) -> HttpResponse | dict:
+        self,
+        method: str,
+        url: str,
+        as_http_response=False,
+        stream=False,
+        endpoint=None,
+        **request_kwargs,
+    ) -> HttpResponse | StreamingHttpResponse | dict:
         """
         Execute the HTTP request and validate the response.
 
@@ -47,20 +153,36 @@ class GatewayClient:
             method: HTTP method (GET, POST, etc.)
             url: Full URL to request
             as_http_response: If True, return HttpResponse object instead of JSON
+            stream: If True along with as_http_response, relay the body to the
+                client in chunks through a StreamingHttpResponse instead of
+                buffering it
+            endpoint: Gateway endpoint being requested, used to pick the
+                timeout of the call and to track its latency
             **request_kwargs: Additional arguments to pass to requests method
 
         Returns:
-            HttpResponse or dict depending on as_http_response flag
+            HttpResponse, StreamingHttpResponse or dict depending on the
+            as_http_response and stream flags
 
         Raises:
             APIException: For all request failures with appropriate error messages
         """
+        has_failures = self._check_circuit()
+        timeout = self.get_timeout(endpoint)
+        started_at = time.monotonic()
         try:
-            response = requests.request(
-                method, url, timeout=self.timeout, **request_kwargs
+            stream = stream and as_http_response
+            session = session_pool.get(self.base_url)
+            response = session.request(
+                method, url, timeout=timeout, stream=stream, **request_kwargs
             )
+            self._record_response(response.status_code, has_failures)
+            self.record_latency(endpoint, time.monotonic() - started_at)
 
             # Handle response based on format requested
+            if stream:
+                return self._get_streaming_http_response(response)
+
             if as_http_response:
                 return HttpResponse(
                     response.content,
@@ -71,54 +193,69 @@ class GatewayClient:
                 )
 
             if response.status_code >= status.HTTP_400_BAD_REQUEST:
-                raise APIException(response.text, response.status_code)
+                raise GatewayAPIException(response.text, response.status_code)
 
             return response.json()
 
+        except APIException:
+            raise
         except requests.Timeout as e:
-            raise APIException(
-                {"error": f"Request timed out after {self.timeout} seconds"},
+            self.circuit_breaker.record_failure()
+            self.record_timeout(endpoint)
+            raise GatewayAPIException(
+                {"error": f"Request timed out after {timeout} seconds"},
                 status.HTTP_504_GATEWAY_TIMEOUT,
             ) from e
+        except json.decoder.JSONDecodeError as e:
+            raise GatewayAPIException(
+                {"error": "Invalid JSON response from gateway device"},
+                status.HTTP_502_BAD_GATEWAY,
+            ) from e
         except (
             requests.ConnectionError,
             requests.exceptions.SSLError,
             requests.exceptions.TooManyRedirects,
             requests.RequestException,
         ) as e:
+            if isinstance(e, requests.ConnectionError):
+                self.circuit_breaker.record_failure()
             logger.error(f"Gateway connection error: {str(e)}")
-            raise APIException(
+            raise GatewayAPIException(
                 {"error": "Failed to connect to gateway device"},
                 status.HTTP_503_SERVICE_UNAVAILABLE,
             ) from e
-        except json.decoder.JSONDecodeError as e:
-            raise APIException(
-                {"error": "Invalid JSON response from gateway device"},
-                status.HTTP_502_BAD_GATEWAY,
-            ) from e
         except Exception as e:
             logger.error(f"Unexpected error during gateway request: {str(e)}")
-            raise APIException(
+            raise GatewayAPIException(
                 {"error": "An unexpected error occurred during gateway request"},
                 status.HTTP_500_INTERNAL_SERVER_ERROR,
             ) from e
 
-    def get(self, endpoint, data=None, as_http_response=False):
+    def _get_request_kwargs(self, method, data):
+        if method == "GET":
+            return {"params": data}
+        return {"json": data}
+
+    def request(
+        self, method, endpoint, data=None, as_http_response=False, stream=False
+    ):
         url = self._get_url(endpoint)
         return self._make_request(
-            "GET",
+            method,
             url,
             as_http_response=as_http_response,
-            params=data,
+            stream=stream,
             headers=self._get_headers(),
+            endpoint=endpoint,
+            **self._get_request_kwargs(method, data),
         )
 
-    def post(self, endpoint, data=None, as_http_response=False):
-        url = self._get_url(endpoint)
-        return self._make_request(
-            "POST",
-            url,
-            as_http_response=as_http_response,
-            json=data,
-            headers=self._get_headers(),
+    def get(self, endpoint, data=None, as_http_response=False, stream=False):
+        return self.request(
+            "GET", endpoint, data, as_http_response=as_http_response, stream=stream
+        )
+
+    def post(self, endpoint, data=None, as_http_response=False, stream=False):
+        return self.request(
+            "POST", endpoint, data, as_http_response=as_http_response, stream=stream
         )
@@ -0,0 +1,155 @@
+import threading
+import time
+
+from django.core.cache import cache
+
+from gateway_device.settings import plugin_settings as settings
+
+MIN_SAMPLES = 20
+FLUSH_EVERY = 10
+TIMEOUT_CACHE_TTL = 30
+SAMPLES_CACHE_TTL = 60 * 60 * 24
+# how long a timed out call keeps the endpoint on its static timeout
+TIMED_OUT_CACHE_TTL = 60 * 5
+MAX_TRACKED_ENDPOINTS = 1024
+
+
+def latency_samples_cache_key(gateway_host: str, endpoint: str) -> str:
+    return f"gateway_latency:{gateway_host}:{endpoint}"
+
+
+def latency_timeouts_cache_key(gateway_host: str, endpoint: str) -> str:
+    return f"gateway_latency_timeouts:{gateway_host}:{endpoint}"
+
+
+def percentile(sorted_samples: list[float], fraction: float) -> float:
+    index = int(round(fraction * (len(sorted_samples) - 1)))
+    return sorted_samples[index]
+
+
+class GatewayLatencyTracker:
+    """
+    Tracks the rolling latency of gateway calls per (gateway, endpoint) and
+    derives the timeout to be used for a call from it.
+
+    Samples are buffered in-process and merged into a window kept in the
+    Django cache every few requests, so that all workers learn from each
+    other without a cache write per request. Timed out calls are counted
+    apart from the samples, and keep the endpoint on its static timeout for
+    a while instead of skewing the percentiles.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending: dict[tuple[str, str], list[float]] = {}
+        self._timeouts: dict[tuple[str, str], tuple[float, float]] = {}
+
+    def get_static_timeout(self, endpoint: str) -> float:
+        return settings.CARE_TELEICU_GATEWAY_OPERATION_TIMEOUTS.get(
+            endpoint, settings.CARE_TELEICU_GATEWAY_API_TIMEOUT
+        )
+
+    def get_timeout(self, gateway_host: str, endpoint: str) -> float:
+        static_timeout = self.get_static_timeout(endpoint)
+        if not settings.CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT:
+            return static_timeout
+
+        key = (gateway_host, endpoint)
+        cached = self._timeouts.get(key)
+        if cached and cached[1] > time.time():
+            return cached[0]
+
+        timeout = static_timeout
+        stats = self.get_stats(gateway_host, endpoint)
+        if stats["count"] >= MIN_SAMPLES and not stats["timeouts"]:
+            timeout = (
+                stats["p99"] * settings.CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT_MULTIPLIER
+            )
+            timeout = min(
+                max(timeout, settings.CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT_FLOOR),
+                settings.CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT_CEILING,
+            )
+        with self._lock:
+            if len(self._timeouts) >= MAX_TRACKED_ENDPOINTS:
+                now = time.time()
+                for stale_key, (_, expires_at) in list(self._timeouts.items()):
+                    if expires_at <= now:
+                        del self._timeouts[stale_key]
+                if len(self._timeouts) >= MAX_TRACKED_ENDPOINTS:
+                    self._timeouts.clear()
+            self._timeouts[key] = (timeout, time.time() + TIMEOUT_CACHE_TTL)
+        return timeout
+
+    def record_timeout(self, gateway_host: str, endpoint: str):
+        if not settings.CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT:
+            return
+        cache_key = latency_timeouts_cache_key(gateway_host, endpoint)
+        cache.add(cache_key, 0, timeout=TIMED_OUT_CACHE_TTL)
+        try:
+            cache.incr(cache_key)
+        except ValueError:
+            # key got evicted in between
+            cache.set(cache_key, 1, timeout=TIMED_OUT_CACHE_TTL)
+        with self._lock:
+            # use the static timeout right away in this worker
+            self._timeouts.pop((gateway_host, endpoint), None)
+
+    def record(self, gateway_host: str, endpoint: str, duration: float):
+        if not settings.CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT:
+            return
+        key = (gateway_host, endpoint)
+        with self._lock:
+            if key not in self._pending and len(self._pending) >= MAX_TRACKED_ENDPOINTS:
+                self._pending.clear()
+            pending = self._pending.setdefault(key, [])
+            pending.append(duration)
+            if len(pending) < FLUSH_EVERY:
+                return
+            self._pending[key] = []
+        self._flush(gateway_host, endpoint, pending)
+
+    def _flush(self, gateway_host: str, endpoint: str, samples: list[float]):
+        # concurrent flushes may drop a few samples, which is acceptable for
+        # a rolling window
+        cache_key = latency_samples_cache_key(gateway_host, endpoint)
+        window = cache.get(cache_key, []) + samples
+        window = window[-settings.CARE_TELEICU_GATEWAY_LATENCY_WINDOW :]
+        cache.set(cache_key, window, timeout=SAMPLES_CACHE_TTL)
+
+    def get_stats(self, gateway_host: str, endpoint: str) -> dict:
+        samples_key = latency_samples_cache_key(gateway_host, endpoint)
+        timeouts_key = latency_timeouts_cache_key(gateway_host, endpoint)
+        values = cache.get_many([samples_key, timeouts_key])
+        samples = sorted(values.get(samples_key, []))
+        timeouts = values.get(timeouts_key, 0)
+        if not samples:
+            return {
+                "count": 0,
+                "timeouts": timeouts,
+                "p50": None,
+                "p95": None,
+                "p99": None,
+            }
+        return {
+            "count": len(samples),
+            "timeouts": timeouts,
+            "p50": percentile(samples, 0.50),
+            "p95": percentile(samples, 0.95),
+            "p99": percentile(samples, 0.99),
+        }
+
+    def all_stats(self) -> list[dict]:
+        with self._lock:
+            keys = set(self._pending) | set(self._timeouts)
+        return [
+            {
+                "gateway": gateway_host,
+                "endpoint": endpoint,
+                "timeout": self.get_timeout(gateway_host, endpoint),
+                **self.get_stats(gateway_host, endpoint),
+            }
+            for gateway_host, endpoint in sorted(keys)
+        ]
+
+
+latency_tracker = GatewayLatencyTracker()
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from gateway_device.circuit_breaker import GatewayCircuitBreaker
+from gateway_device.settings import plugin_settings as settings
+
+
+class GatewaySession:
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=settings.CARE_TELEICU_GATEWAY_POOL_MAXSIZE,
+            pool_block=False,
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.created_at = time.time()
+        self.last_used = self.created_at
+        self.request_count = 0
+
+    def touch(self):
+        self.last_used = time.time()
+        self.request_count += 1
+
+    def close(self):
+        self.session.close()
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "circuit": GatewayCircuitBreaker(
+                self.base_url.split("://", 1)[1]
+            ).as_dict(),
+            "created_at": self.created_at,
+            "last_used": self.last_used,
+            "request_count": self.request_count,
+            "pool_maxsize": settings.CARE_TELEICU_GATEWAY_POOL_MAXSIZE,
+        }
+
+
+class GatewaySessionPool:
+    """
+    Process-wide registry of keep-alive `requests.Session` objects, one per
+    gateway base url, so that repeated calls to the same gateway reuse the
+    underlying TCP/TLS connections.
+    """
+
+    def __init__(self):
+        self._sessions: dict[str, GatewaySession] = {}
+        self._lock = threading.Lock()
+
+    def get(self, base_url: str) -> requests.Session:
+        with self._lock:
+            self._evict_idle()
+            gateway_session = self._sessions.get(base_url)
+            if gateway_session is None:
+                gateway_session = GatewaySession(base_url)
+                self._sessions[base_url] = gateway_session
+            gateway_session.touch()
+            return gateway_session.session
+
+    def _evict_idle(self):
+        idle_timeout = settings.CARE_TELEICU_GATEWAY_POOL_IDLE_TIMEOUT
+        if not idle_timeout:
+            return
+        cutoff = time.time() - idle_timeout
+        for base_url, gateway_session in list(self._sessions.items()):
+            if gateway_session.last_used < cutoff:
+                gateway_session.close()
+                del self._sessions[base_url]
+
+    def clear(self):
+        with self._lock:
+            for gateway_session in self._sessions.values():
+                gateway_session.close()
+            self._sessions.clear()
+
+    def stats(self) -> list[dict]:
+        with self._lock:
+            return [
+                gateway_session.stats() for gateway_session in self._sessions.values()
+            ]
+
+
+session_pool = GatewaySessionPool()
+
@@ -102,6 +102,27 @@ REQUIRED_SETTINGS = {
 
 DEFAULTS = {
     "CARE_TELEICU_GATEWAY_API_TIMEOUT": 25,
+    "CARE_TELEICU_GATEWAY_POOL_MAXSIZE": 10,
+    "CARE_TELEICU_GATEWAY_POOL_IDLE_TIMEOUT": 300,
+    "CARE_TELEICU_GATEWAY_JWT_REFRESH_MARGIN": 10,
+    "CARE_TELEICU_GATEWAY_JWT_AUDIENCE": False,
+    "CARE_TELEICU_GATEWAY_CIRCUIT_BREAKER_ENABLED": True,
+    "CARE_TELEICU_GATEWAY_CIRCUIT_FAILURE_THRESHOLD": 3,
+    "CARE_TELEICU_GATEWAY_CIRCUIT_RESET_TIMEOUT": 30,
+    "CARE_TELEICU_GATEWAY_STREAM_RESPONSES": False,
+    "CARE_TELEICU_GATEWAY_STREAM_CHUNK_SIZE": 64 * 1024,
+    "CARE_TELEICU_GATEWAY_STREAM_MAX_SIZE": 50 * 1024 * 1024,
+    "CARE_TELEICU_GATEWAY_OPERATION_TIMEOUTS": {},
+    "CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT": False,
+    "CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT_MULTIPLIER": 3.0,
+    "CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT_FLOOR": 2.0,
+    "CARE_TELEICU_GATEWAY_ADAPTIVE_TIMEOUT_CEILING": 25.0,
+    "CARE_TELEICU_GATEWAY_LATENCY_WINDOW": 200,
+    "CARE_TELEICU_GATEWAY_TOKEN_CACHE_SIZE": 1024,
+    "CARE_TELEICU_GATEWAY_INVALID_TOKEN_CACHE_TTL": 60,
+    "CARE_TELEICU_GATEWAY_JWKS_CACHE_TTL": 60 * 5,
+    "CARE_TELEICU_GATEWAY_JWKS_REFRESH_AHEAD": 60,
+    "CARE_TELEICU_GATEWAY_JWKS_STALE_GRACE": 60 * 60,
 }
 
 plugin_settings = PluginSettings(
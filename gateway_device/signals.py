@@ -0,0 +1,29 @@
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from care.emr.models import Device
+from care.users.models import User
+from gateway_device.auth_cache import gateway_device_cache_key, service_user_cache_key
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_gateway_device_cache(sender, instance, **kwargs):
+    """
+    Drops the cached gateway device used by the gateway authentication so
+    that metadata changes take effect on the next request.
+
+    The cache is invalidated regardless of the care type, as a device that is
+    no longer a gateway may still be cached as one, and only once the change
+    is committed so that a concurrent request does not cache the old row.
+    """
+    cache_key = gateway_device_cache_key(instance.external_id)
+    transaction.on_commit(lambda: cache.delete(cache_key))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_service_user_cache(sender, instance, **kwargs):
+    cache.delete(service_user_cache_key(instance.username))
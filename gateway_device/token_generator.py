@@ -1,7 +1,17 @@
+import json
+import threading
+
 from authlib.jose import jwt
 from django.conf import settings
 from django.utils.timezone import now
 
+from gateway_device.settings import plugin_settings
+
+MAX_CACHED_TOKENS = 1024
+
+_token_cache: dict[tuple, tuple[str, int]] = {}
+_token_cache_lock = threading.Lock()
+
 
 def generate_jwt(claims=None, exp=60, jwks=None):
     if claims is None:
@@ -16,3 +26,57 @@ def generate_jwt(claims=None, exp=60, jwks=None):
         **claims,
     }
     return jwt.encode(header, payload, jwks).decode("utf-8")
+
+
+def _get_key_id(key):
+    # the thumbprint is derived from the public key itself, so it stays the
+    # same when the same key is loaded again
+    return getattr(key, "kid", None) or key.thumbprint()
+
+
+def _get_key_set_id(jwks):
+    keys = getattr(jwks, "keys", None)
+    if keys is not None:
+        return tuple(_get_key_id(key) for key in keys)
+    return _get_key_id(jwks)
+
+
+def get_cached_jwt(claims=None, exp=60, jwks=None):
+    """
+    Returns a signed token for the given claims, reusing a previously signed
+    token until it is within the configured refresh margin of its expiry.
+    """
+    if jwks is None:
+        jwks = settings.JWKS
+    cache_key = (
+        json.dumps(claims or {}, sort_keys=True, default=str),
+        exp,
+        _get_key_set_id(jwks),
+    )
+    refresh_margin = min(
+        plugin_settings.CARE_TELEICU_GATEWAY_JWT_REFRESH_MARGIN, exp // 2
+    )
+
+    time = int(now().timestamp())
+    with _token_cache_lock:
+        cached = _token_cache.get(cache_key)
+    if cached and time < cached[1] - refresh_margin:
+        return cached[0]
+
+    # signing is the expensive part, concurrent misses for the same claims may
+    # sign twice but misses for different claims do not wait on each other
+    token = generate_jwt(claims, exp=exp, jwks=jwks)
+    with _token_cache_lock:
+        if len(_token_cache) >= MAX_CACHED_TOKENS:
+            for key, (_, expires_at) in list(_token_cache.items()):
+                if expires_at - refresh_margin <= time:
+                    del _token_cache[key]
+            if len(_token_cache) >= MAX_CACHED_TOKENS:
+                _token_cache.clear()
+        _token_cache[cache_key] = (token, time + exp)
+        return token
+
+
+def clear_jwt_cache():
+    with _token_cache_lock:
+        _token_cache.clear()
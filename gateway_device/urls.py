@@ -1,8 +1,10 @@
+from gateway_device.viewsets.monitoring import GatewayMonitoringViewSet
 from gateway_device.viewsets.open_id import PublicJWKsView
 from rest_framework.routers import DefaultRouter
 
 router = DefaultRouter()
 
+router.register("monitoring", GatewayMonitoringViewSet, basename="gateway-monitoring")
 router.register("", PublicJWKsView, basename="public-jwks")
 
 urlpatterns = router.urls
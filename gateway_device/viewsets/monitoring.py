@@ -0,0 +1,26 @@
+from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet
+
+from gateway_device.latency import latency_tracker
+from gateway_device.sessions import session_pool
+
+
+class GatewayMonitoringViewSet(GenericViewSet):
+    """
+    Runtime statistics of the gateway client for monitoring
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if not request.user.is_superuser:
+            raise PermissionDenied("Only superusers can view gateway statistics")
+
+    @action(detail=False, methods=["GET"])
+    def sessions(self, request, *args, **kwargs):
+        return Response(session_pool.stats())
+
+    @action(detail=False, methods=["GET"])
+    def latency(self, request, *args, **kwargs):
+        return Response(latency_tracker.all_stats())
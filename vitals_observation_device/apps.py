@@ -19,3 +19,7 @@ class VitalsObservationDeviceConfig(AppConfig):
         from vitals_observation_device.device import VitalsObservationDevice
 
         DeviceTypeRegistry.register("vitals-observation", VitalsObservationDevice)
+
+        from vitals_observation_device.ingestion import compile_validators
+
+        compile_validators()
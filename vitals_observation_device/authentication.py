@@ -1,14 +1,14 @@
 from rest_framework_simplejwt.tokens import Token
 
-from care.users.models import User
+from gateway_device.auth_cache import get_service_user
 from gateway_device.authentication import GatewayAuthentication
 
 
 class AutomatedObservationsAuthentication(GatewayAuthentication):
 
     def get_user(self, _: Token):
-        user, _ = User.objects.get_or_create(
-            username="automated-observations",
+        return get_service_user(
+            "automated-observations",
             defaults={
                 "first_name": "Automated",
                 "last_name": "Observations",
@@ -18,4 +18,3 @@ class AutomatedObservationsAuthentication(GatewayAuthentication):
                 "is_active": False,
             },
         )
-        return user
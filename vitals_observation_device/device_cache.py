@@ -0,0 +1,192 @@
+"""
+Cached state of the vitals observation devices, invalidated by the device
+signals.
+
+Every change to the device list of a gateway bumps its version and records
+the change under the new version, so that gateways can fetch the changes
+since the version they last saw.
+"""
+
+import time
+import uuid
+
+from django.core.cache import cache
+
+from care.emr.models import Device, Encounter
+from vitals_observation_device.settings import plugin_settings as settings
+
+# changes are kept long enough for gateways reconnecting after a short outage,
+# older versions are answered with the full device list
+CHANGE_LOG_TTL = 60 * 60
+MAX_CHANGES = 500
+
+
+def gateway_devices_version_cache_key(gateway_external_id) -> str:
+    return f"gateway_vitals_devices_version:{gateway_external_id}"
+
+
+def gateway_devices_change_cache_key(gateway_external_id, version: int) -> str:
+    return f"gateway_vitals_devices_change:{gateway_external_id}:{version}"
+
+
+def _initial_version() -> int:
+    # start from the current time rather than zero, so that a version lost
+    # from the cache is never handed out again
+    return int(time.time() * 1000)
+
+
+def get_gateway_devices_version(gateway_external_id) -> int:
+    """
+    Version of the device list of the gateway, bumped whenever a device is
+    assigned to or removed from the gateway, or its endpoint or encounter
+    changes.
+    """
+    cache_key = gateway_devices_version_cache_key(gateway_external_id)
+    cache.add(cache_key, _initial_version(), timeout=None)
+    return cache.get(cache_key)
+
+
+def get_gateway_devices_etag(gateway_external_id) -> str:
+    return f'"{gateway_external_id}:{get_gateway_devices_version(gateway_external_id)}"'
+
+
+def record_device_change(
+    gateway_external_id, device_external_id, endpoint_address: str | None = None
+):
+    """
+    Records that the device was added to or updated in the device list of the
+    gateway, or removed from it when `endpoint_address` is None.
+    """
+    if not gateway_external_id:
+        return
+    cache_key = gateway_devices_version_cache_key(gateway_external_id)
+    try:
+        version = cache.incr(cache_key)
+    except ValueError:
+        cache.add(cache_key, _initial_version(), timeout=None)
+        version = cache.incr(cache_key)
+    change = {"version": version, "id": str(device_external_id)}
+    if endpoint_address is None:
+        change["removed"] = True
+    else:
+        change["endpoint_address"] = endpoint_address
+    cache.set(
+        gateway_devices_change_cache_key(gateway_external_id, version),
+        change,
+        timeout=CHANGE_LOG_TTL,
+    )
+
+
+def get_device_changes(gateway_external_id, since: int, version: int) -> list | None:
+    """
+    Returns the changes to the device list of the gateway after `since` up to
+    `version`, or None if they are no longer available.
+    """
+    if since >= version:
+        return []
+    if version - since > MAX_CHANGES:
+        return None
+    keys = [
+        gateway_devices_change_cache_key(gateway_external_id, v)
+        for v in range(since + 1, version + 1)
+    ]
+    changes = cache.get_many(keys)
+    if len(changes) != len(keys):
+        return None
+    return [changes[key] for key in keys]
+
+
+def device_route_cache_key(device_external_id) -> str:
+    return f"vitals_device_route:{device_external_id}"
+
+
+def invalidate_device_routes(*device_external_ids):
+    cache.delete_many(
+        [device_route_cache_key(external_id) for external_id in device_external_ids]
+    )
+
+
+def get_device_routes(device_external_ids) -> dict[str, dict]:
+    """
+    Returns where the observations of each vitals observation device are
+    routed to, ie. its gateway and current encounter and patient, by device
+    external id. Devices that do not exist are left out.
+
+    Routes missing from the cache are fetched with a single query. Cached
+    routes are invalidated by the signals of the device and its encounter
+    history, `QuerySet.update` sends none and has to invalidate them itself.
+    """
+    keys = {}
+    for external_id in device_external_ids:
+        try:
+            external_id = str(uuid.UUID(str(external_id)))
+        except ValueError:
+            continue
+        keys[device_route_cache_key(external_id)] = external_id
+    routes = {
+        keys[cache_key]: route
+        for cache_key, route in cache.get_many(list(keys)).items()
+    }
+    missing = [
+        external_id for external_id in keys.values() if external_id not in routes
+    ]
+    if missing:
+        fetched = {}
+        queryset = Device.objects.filter(
+            care_type="vitals-observation", external_id__in=missing
+        ).values_list(
+            "id",
+            "external_id",
+            "metadata",
+            "current_encounter_id",
+            "current_encounter__external_id",
+            "current_encounter__patient_id",
+        )
+        for row in queryset:
+            pk, external_id, metadata, encounter_pk, encounter_id, patient_pk = row
+            metadata = metadata or {}
+            fetched[str(external_id)] = {
+                "device_pk": pk,
+                "device_external_id": str(external_id),
+                "device_type": metadata.get("type"),
+                "gateway": metadata.get("gateway"),
+                "encounter_pk": encounter_pk,
+                "encounter_external_id": str(encounter_id) if encounter_id else None,
+                "patient_pk": patient_pk,
+            }
+        # devices that do not exist are not cached, so that a device created
+        # after being looked up is routed right away
+        cache.set_many(
+            {
+                device_route_cache_key(external_id): route
+                for external_id, route in fetched.items()
+            },
+            timeout=settings.CARE_TELEICU_OBSERVATIONS_ROUTE_CACHE_TTL,
+        )
+        routes.update(fetched)
+    return {external_id: route for external_id, route in routes.items() if route}
+
+
+def get_route_device(route: dict) -> Device:
+    """
+    Unsaved stand-in of the routed device with the fields used by the
+    ingestion, to avoid fetching it.
+    """
+    return Device(
+        id=route["device_pk"],
+        external_id=route["device_external_id"],
+        care_type="vitals-observation",
+        metadata={"type": route["device_type"], "gateway": route["gateway"]},
+    )
+
+
+def get_route_encounter(route: dict) -> Encounter:
+    """
+    Unsaved stand-in of the routed encounter with the fields used by the
+    ingestion, to avoid fetching it.
+    """
+    return Encounter(
+        id=route["encounter_pk"],
+        external_id=route["encounter_external_id"],
+        patient_id=route["patient_pk"],
+    )
@@ -0,0 +1,193 @@
+"""
+Ingestion time downsampling of high frequency readings.
+
+Policies are configured per device type and observation code with
+`CARE_TELEICU_OBSERVATIONS_DOWNSAMPLING`, eg.
+
+    {
+        "HL7-Monitor": {
+            "*": {"mode": "sample", "window": 60},
+            "8867-4": {"mode": "sample", "window": 60, "low": 40, "high": 140},
+        }
+    }
+
+`sample` keeps the first reading of each window per encounter, `passthrough`
+records every reading. Readings outside `low` / `high`, interpreted as
+abnormal by the device or without an effective datetime are always recorded.
+Policies with any other mode are ignored with a warning.
+
+A window is claimed for a short while when its reading is kept, and for the
+rest of the window once the reading is committed, so that a failed insert
+does not lose the sample of the window to its retry.
+"""
+
+import logging
+import math
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.core.cache import cache
+
+from care.emr.models import Observation
+from vitals_observation_device.settings import plugin_settings as settings
+
+logger = logging.getLogger(__name__)
+
+WILDCARD_CODE = "*"
+NORMAL_INTERPRETATION_CODES = {"N", "normal"}
+
+
+# how long a window stays claimed by a reading that is yet to be committed
+SAMPLE_CLAIM_TIMEOUT = 30
+
+
+class DownsamplingMode:
+    passthrough = "passthrough"
+    sample = "sample"
+
+
+def sample_window_cache_key(
+    device_external_id, encounter_id, code: str, window: int
+) -> str:
+    return f"observation_downsample:{device_external_id}:{encounter_id}:{code}:{window}"
+
+
+def get_observation_code(observation: Observation) -> tuple[str | None, str | None]:
+    code = observation.main_code or {}
+    return code.get("system"), code.get("code")
+
+
+@lru_cache
+def warn_invalid_policy(device_type: str | None, key: str, reason: str):
+    # cached, so that a misconfigured policy is reported once per process
+    # rather than for every reading it applies to
+    logger.warning(
+        "Ignoring downsampling policy %r of %r, %s", key, device_type, reason
+    )
+
+
+def get_policy(device_type: str | None, observation: Observation) -> dict | None:
+    policies = settings.CARE_TELEICU_OBSERVATIONS_DOWNSAMPLING.get(device_type)
+    if not policies:
+        return None
+    system, code = get_observation_code(observation)
+    for key in (f"{system}|{code}", code, WILDCARD_CODE):
+        if key in policies:
+            policy = policies[key]
+            mode = policy.get("mode", DownsamplingMode.passthrough)
+            if mode == DownsamplingMode.passthrough:
+                return None
+            if mode != DownsamplingMode.sample:
+                warn_invalid_policy(device_type, key, f"unknown mode {mode!r}")
+                return None
+            if not policy.get("window"):
+                warn_invalid_policy(device_type, key, "no window is set")
+                return None
+            return policy
+    return None
+
+
+def get_numeric_value(observation: Observation) -> Decimal | None:
+    value = (observation.value or {}).get("value")
+    if value is None:
+        return None
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        return None
+    return value if value.is_finite() else None
+
+
+def is_significant(observation: Observation, policy: dict) -> bool:
+    """
+    Whether the reading should be recorded regardless of the policy, ie. it
+    is out of the configured range or flagged as abnormal by the device.
+    """
+    interpretations = observation.interpretation or []
+    if isinstance(interpretations, dict):
+        interpretations = [interpretations]
+    for interpretation in interpretations:
+        code = interpretation.get("code") if isinstance(interpretation, dict) else None
+        if code and code not in NORMAL_INTERPRETATION_CODES:
+            return True
+    value = get_numeric_value(observation)
+    if value is None:
+        return False
+    low = policy.get("low")
+    high = policy.get("high")
+    return (low is not None and value < low) or (high is not None and value > high)
+
+
+def get_window(observation: Observation, policy: dict) -> int:
+    return math.floor(observation.effective_datetime.timestamp() / policy["window"])
+
+
+def _sample(device_external_id, code, observations, policy) -> list[Observation]:
+    windows = {}
+    for observation in observations:
+        windows.setdefault(
+            (observation.encounter_id, get_window(observation, policy)), observation
+        )
+    kept = []
+    for (encounter_id, window), observation in windows.items():
+        cache_key = sample_window_cache_key(
+            device_external_id, encounter_id, code, window
+        )
+        if cache.add(cache_key, 1, timeout=SAMPLE_CLAIM_TIMEOUT):
+            observation._sample_claim = (cache_key, policy["window"] * 2)
+            kept.append(observation)
+    return kept
+
+
+def confirm_sample_claims(observations: list[Observation]):
+    """
+    Holds the windows claimed by the committed readings until they end.
+    """
+    for observation in observations:
+        if claim := getattr(observation, "_sample_claim", None):
+            cache.set(claim[0], 1, timeout=claim[1])
+
+
+def release_sample_claims(observations: list[Observation]):
+    claims = [
+        observation._sample_claim[0]
+        for observation in observations
+        if hasattr(observation, "_sample_claim")
+    ]
+    if claims:
+        cache.delete_many(claims)
+
+
+def downsample_observations(
+    device_external_id, device_type: str | None, observations: list[Observation]
+) -> list[Observation]:
+    """
+    Applies the downsampling policy of the device type to the readings and
+    returns the ones to be recorded.
+    """
+    if not settings.CARE_TELEICU_OBSERVATIONS_DOWNSAMPLING:
+        return observations
+
+    kept = []
+    groups = defaultdict(list)
+    policies = {}
+    for observation in observations:
+        policy = get_policy(device_type, observation)
+        if (
+            policy is None
+            # undated readings can not be placed in a window
+            or observation.effective_datetime is None
+            or is_significant(observation, policy)
+        ):
+            kept.append(observation)
+            continue
+        code = "|".join(map(str, get_observation_code(observation)))
+        groups[code].append(observation)
+        policies[code] = policy
+
+    for code, group in groups.items():
+        policy = policies[code]
+        group.sort(key=lambda observation: observation.effective_datetime)
+        kept.extend(_sample(device_external_id, code, group, policy))
+    return kept
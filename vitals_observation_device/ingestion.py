@@ -0,0 +1,300 @@
+import json
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+from pydantic import TypeAdapter
+from pydantic import ValidationError as PydanticValidationError
+
+from care.emr.models import Observation
+from care.emr.resources.observation.spec import ObservationSpec
+from care.emr.resources.questionnaire.spec import SubjectType
+from vitals_observation_device.downsampling import (
+    confirm_sample_claims,
+    downsample_observations,
+    release_sample_claims,
+)
+from vitals_observation_device.latest_vitals import update_recorded_latest_vitals
+from vitals_observation_device.settings import plugin_settings as settings
+
+MAX_REPORTED_ERRORS = 100
+# namespace of the deterministic external ids derived from the natural key of
+# automated observations
+OBSERVATION_NAMESPACE = uuid.UUID("5b0c54a4-3f5e-4c51-9d0e-6f9d9d3c6c1e")
+
+_observation_list_adapter: TypeAdapter | None = None
+
+
+def compile_validators():
+    """
+    Builds the list level validator of the observations once, so that
+    batches are validated in a single call instead of a model per reading.
+    """
+    global _observation_list_adapter  # noqa: PLW0603
+    _observation_list_adapter = TypeAdapter(list[ObservationSpec])
+
+
+def get_observation_list_adapter() -> TypeAdapter:
+    if _observation_list_adapter is None:
+        compile_validators()
+    return _observation_list_adapter
+
+
+def build_observation(encounter, observation, user) -> Observation:
+    """
+    Validates an observation posted for the encounter and returns the unsaved
+    `Observation` object for it.
+    """
+    temp = ObservationSpec(
+        **observation,
+        subject_type=SubjectType.encounter,
+        encounter=encounter.external_id,
+        data_entered_by_id=user.id,
+        created_by_id=user.id,
+        updated_by_id=user.id,
+    ).de_serialize()
+    temp.patient_id = encounter.patient_id
+    temp.encounter = encounter
+    temp.subject_id = encounter.external_id
+    temp.external_id = uuid.uuid4()
+    return temp
+
+
+def with_common_fields(observation, common: dict) -> dict:
+    for field in common:
+        if field in observation:
+            # same failure as `build_observation` passing the field twice
+            raise TypeError(
+                f"ObservationSpec() got multiple values for keyword argument '{field}'"
+            )
+    return {**observation, **common}
+
+
+def build_observations_batch(encounter, observations, user) -> list[Observation]:
+    """
+    Same as `build_observations`, but validates the whole batch with the
+    precompiled list validator and resolves the encounter derived fields once
+    for the batch.
+    """
+    common = {
+        "subject_type": SubjectType.encounter,
+        "encounter": encounter.external_id,
+        "data_entered_by_id": user.id,
+        "created_by_id": user.id,
+        "updated_by_id": user.id,
+    }
+    specs = get_observation_list_adapter().validate_python(
+        [with_common_fields(observation, common) for observation in observations]
+    )
+    patient_id = encounter.patient_id
+    subject_id = encounter.external_id
+    bulk = []
+    for spec in specs:
+        temp = spec.de_serialize()
+        temp.patient_id = patient_id
+        temp.encounter = encounter
+        temp.subject_id = subject_id
+        temp.external_id = uuid.uuid4()
+        bulk.append(temp)
+    return bulk
+
+
+def build_observations(encounter, observations, user) -> list[Observation]:
+    """
+    Validates the observations posted for the encounter and returns the
+    unsaved `Observation` objects for them.
+    """
+    if settings.CARE_TELEICU_OBSERVATIONS_FAST_VALIDATION:
+        return build_observations_batch(encounter, observations, user)
+    return [
+        build_observation(encounter, observation, user) for observation in observations
+    ]
+
+
+def recent_observation_cache_key(natural_key: str) -> str:
+    return f"recent_observation:{natural_key}"
+
+
+def observation_natural_key(device_external_id, observation: Observation) -> str:
+    code = observation.main_code or {}
+    if isinstance(code, dict):
+        code = f"{code.get('system')}|{code.get('code')}"
+    return (
+        f"{device_external_id}:{observation.encounter_id}:{code}:"
+        f"{observation.effective_datetime}"
+    )
+
+
+def deduplicate_observations(
+    device_external_id, observations: list[Observation]
+) -> list[Observation]:
+    """
+    Assigns each observation an external id derived from its natural key
+    (device, encounter, code, effective datetime) and drops the ones recorded
+    recently or repeated within the batch.
+
+    Readings without an effective datetime cannot be told apart from later
+    readings of the same code, and are never deduplicated. Duplicates that are
+    not caught here are left out while inserting.
+    """
+    if not settings.CARE_TELEICU_OBSERVATIONS_DEDUPLICATE:
+        return observations
+
+    keyed = set()
+    unique = []
+    for observation in observations:
+        if observation.effective_datetime is None:
+            unique.append(observation)
+            continue
+        natural_key = observation_natural_key(device_external_id, observation)
+        cache_key = recent_observation_cache_key(natural_key)
+        if cache_key in keyed:
+            continue
+        keyed.add(cache_key)
+        observation.external_id = uuid.uuid5(OBSERVATION_NAMESPACE, natural_key)
+        observation._recent_cache_key = cache_key
+        unique.append(observation)
+    recent = cache.get_many(list(keyed))
+    return [
+        observation
+        for observation in unique
+        if getattr(observation, "_recent_cache_key", None) not in recent
+    ]
+
+
+def prepare_observations(
+    device_external_id, device_type, observations: list[Observation]
+) -> list[Observation]:
+    """
+    Drops the duplicate readings of the device and downsamples the rest as
+    configured for the device type.
+    """
+    observations = deduplicate_observations(device_external_id, observations)
+    for observation in observations:
+        # the latest vitals of the device are updated once these are recorded
+        observation._device_external_id = device_external_id
+    return downsample_observations(device_external_id, device_type, observations)
+
+
+def insert_observations(observations: list[Observation]) -> list[Observation]:
+    """
+    Inserts the observations and returns the ones actually created, leaving
+    out the deduplicated readings that are already recorded.
+
+    Once the insert is committed, the downsampling windows claimed by the
+    readings are held and the latest vitals are updated with the created
+    ones. The windows are freed for the retry if the insert fails.
+    """
+    try:
+        created = _insert_observations(observations)
+    except Exception:
+        release_sample_claims(observations)
+        raise
+
+    def on_commit():
+        confirm_sample_claims(observations)
+        update_recorded_latest_vitals(created)
+
+    transaction.on_commit(on_commit)
+    return created
+
+
+def _insert_observations(observations: list[Observation]) -> list[Observation]:
+    if not settings.CARE_TELEICU_OBSERVATIONS_DEDUPLICATE:
+        return Observation.objects.bulk_create(observations)
+
+    recent = {
+        observation._recent_cache_key: 1
+        for observation in observations
+        if hasattr(observation, "_recent_cache_key")
+    }
+    if recent:
+        recorded = set(
+            Observation.objects.filter(
+                external_id__in=[
+                    observation.external_id
+                    for observation in observations
+                    if hasattr(observation, "_recent_cache_key")
+                ]
+            ).values_list("external_id", flat=True)
+        )
+        observations = [
+            observation
+            for observation in observations
+            if observation.external_id not in recorded
+        ]
+    # readings recorded concurrently in the meantime are still ignored by the
+    # unique index on the external id
+    Observation.objects.bulk_create(observations, ignore_conflicts=True)
+    if recent:
+        # readings of a rolled back insert are not recent, so that their retry
+        # goes through
+        transaction.on_commit(
+            lambda: cache.set_many(
+                recent, timeout=settings.CARE_TELEICU_OBSERVATIONS_RECENT_KEY_TTL
+            )
+        )
+    return observations
+
+
+def ingest_ndjson_stream(encounter, stream, user, chunk_size: int, device=None) -> dict:
+    """
+    Records observations from a newline delimited JSON stream, validating and
+    inserting them in chunks of `chunk_size` so that memory use does not grow
+    with the size of the payload.
+
+    Returns the number of accepted and rejected observations, and of the
+    observations created for the accepted ones once duplicates and
+    downsampled readings are left out, along with the errors of the first few
+    rejected lines.
+    """
+    device_external_id = device.external_id if device else None
+    device_type = device.metadata.get("type") if device else None
+    accepted = 0
+    created = 0
+    rejected = 0
+    errors = []
+    chunk = []
+
+    def reject(line_number, error):
+        nonlocal rejected
+        rejected += 1
+        if len(errors) < MAX_REPORTED_ERRORS:
+            errors.append({"line": line_number, "error": error})
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            observation = json.loads(line)
+            if not isinstance(observation, dict):
+                raise ValueError("Expected a JSON object")
+            chunk.append(build_observation(encounter, observation, user))
+        except PydanticValidationError as e:
+            reject(line_number, e.errors(include_url=False, include_context=False))
+        except ValueError as e:
+            reject(line_number, str(e))
+
+        if len(chunk) >= chunk_size:
+            accepted += len(chunk)
+            created += len(
+                insert_observations(
+                    prepare_observations(device_external_id, device_type, chunk)
+                )
+            )
+            chunk = []
+
+    if chunk:
+        accepted += len(chunk)
+        created += len(
+            insert_observations(
+                prepare_observations(device_external_id, device_type, chunk)
+            )
+        )
+
+    return {
+        "accepted": accepted,
+        "created": created,
+        "rejected": rejected,
+        "errors": errors,
+    }
@@ -0,0 +1,226 @@
+import logging
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DataError, IntegrityError, transaction
+from django.utils import timezone
+from pydantic import ValidationError as PydanticValidationError
+
+from care.emr.models import Encounter
+from care.users.models import User
+from vitals_observation_device.ingestion import (
+    build_observations,
+    insert_observations,
+    prepare_observations,
+)
+from vitals_observation_device.models import (
+    ObservationIngestion,
+    ObservationIngestionStatus,
+)
+from vitals_observation_device.settings import plugin_settings as settings
+
+logger = logging.getLogger(__name__)
+
+QUEUE_DRAIN_SCHEDULED_CACHE_KEY = "observation_ingestion_queue:scheduled"
+# how long processed ingestions are kept around for their status
+INGESTION_RETENTION = timedelta(days=1)
+
+
+def serialize_ingestion(ingestion: ObservationIngestion) -> dict:
+    status = {
+        "id": str(ingestion.external_id),
+        "gateway": str(ingestion.gateway),
+        "device": str(ingestion.device),
+        "status": ingestion.status,
+        "count": ingestion.count,
+        "queued_at": ingestion.created_date.timestamp(),
+    }
+    if ingestion.errors is not None:
+        status["errors"] = ingestion.errors
+    if ingestion.completed_date is not None:
+        status["completed_at"] = ingestion.completed_date.timestamp()
+    return status
+
+
+def get_ingestion_status(ingestion_id: str) -> dict | None:
+    try:
+        ingestion = ObservationIngestion.objects.defer("observations").get(
+            external_id=ingestion_id
+        )
+    except (ObservationIngestion.DoesNotExist, ValueError, ValidationError):
+        return None
+    return serialize_ingestion(ingestion)
+
+
+def get_queue_stats() -> dict:
+    return {
+        "depth": ObservationIngestion.objects.filter(
+            status=ObservationIngestionStatus.queued
+        ).count()
+    }
+
+
+def schedule_queue_drain():
+    from vitals_observation_device.tasks.ingest_observations import (
+        drain_observation_queue,
+    )
+
+    # schedule a single drain per coalescing window, payloads queued in the
+    # meantime are picked up by the same run, and the periodic drain picks up
+    # anything a lost schedule would leave behind
+    window = settings.CARE_TELEICU_OBSERVATIONS_ASYNC_COALESCE_WINDOW
+    if cache.add(QUEUE_DRAIN_SCHEDULED_CACHE_KEY, 1, timeout=window):
+        drain_observation_queue.apply_async(countdown=window)
+
+
+def enqueue_observations(gateway, device, encounter, user, observations) -> str:
+    """
+    Queues the observations posted for the device to be recorded by the
+    ingestion worker and returns the id to track the ingestion with.
+    """
+    ingestion = ObservationIngestion.objects.create(
+        gateway=gateway.external_id,
+        device=device.external_id,
+        device_type=device.metadata.get("type"),
+        encounter=encounter.external_id,
+        user_id=user.id,
+        observations=observations,
+        count=len(observations),
+    )
+    transaction.on_commit(schedule_queue_drain)
+    return str(ingestion.external_id)
+
+
+def _fail(ingestion: ObservationIngestion, errors):
+    ingestion.status = ObservationIngestionStatus.failed
+    ingestion.errors = errors
+    ingestion.completed_date = timezone.now()
+
+
+def _build(ingestion, encounters, users) -> list:
+    """
+    Returns the observations to insert for the queued payload, or marks the
+    ingestion failed and returns none.
+    """
+    encounter = encounters.get(ingestion.encounter)
+    if encounter is None:
+        _fail(ingestion, "Encounter not found")
+        return []
+    user = users.get(ingestion.user_id)
+    if user is None:
+        _fail(ingestion, "User not found")
+        return []
+    try:
+        observations = build_observations(encounter, ingestion.observations, user)
+        return prepare_observations(
+            ingestion.device, ingestion.device_type, observations
+        )
+    except PydanticValidationError as e:
+        _fail(ingestion, e.errors(include_url=False, include_context=False))
+    except ValueError as e:
+        _fail(ingestion, str(e))
+    except Exception as e:
+        # a payload that cannot be processed must not hold up the queue
+        logger.exception(
+            "Failed to process observation ingestion %s", ingestion.id
+        )
+        _fail(ingestion, str(e))
+    return []
+
+
+def _insert(ingestions, bulk: dict):
+    """
+    Inserts the observations of the ingestions with a single bulk insert, or
+    one ingestion at a time to single out the ones the database rejects.
+    """
+    try:
+        with transaction.atomic():
+            insert_observations(
+                [
+                    observation
+                    for ingestion in ingestions
+                    for observation in bulk[ingestion.id]
+                ]
+            )
+        return
+    except (DataError, IntegrityError):
+        logger.warning("Failed to record observation ingestions in bulk")
+    for ingestion in ingestions:
+        try:
+            with transaction.atomic():
+                insert_observations(bulk[ingestion.id])
+        except (DataError, IntegrityError) as e:
+            logger.exception(
+                "Failed to record observation ingestion %s", ingestion.id
+            )
+            _fail(ingestion, str(e))
+
+
+def process_queue_batch() -> int:
+    """
+    Records the next batch of queued payloads with a single bulk insert.
+
+    Rows are claimed with `SKIP LOCKED`, so that concurrent workers drain
+    disjoint batches. Database errors roll back the batch, which then stays
+    queued for the retry.
+
+    Returns the number of payloads processed.
+    """
+    with transaction.atomic():
+        ingestions = list(
+            ObservationIngestion.objects.select_for_update(skip_locked=True)
+            .filter(status=ObservationIngestionStatus.queued)
+            .order_by("id")[: settings.CARE_TELEICU_OBSERVATIONS_ASYNC_MAX_BATCH]
+        )
+        if not ingestions:
+            return 0
+
+        encounters = Encounter.objects.in_bulk(
+            {ingestion.encounter for ingestion in ingestions},
+            field_name="external_id",
+        )
+        users = User.objects.in_bulk({ingestion.user_id for ingestion in ingestions})
+
+        bulk = {
+            ingestion.id: _build(ingestion, encounters, users)
+            for ingestion in ingestions
+        }
+        pending = [
+            ingestion
+            for ingestion in ingestions
+            if ingestion.status == ObservationIngestionStatus.queued
+        ]
+        if pending:
+            _insert(pending, bulk)
+
+        now = timezone.now()
+        for ingestion in ingestions:
+            if ingestion.status == ObservationIngestionStatus.queued:
+                ingestion.status = ObservationIngestionStatus.completed
+                ingestion.completed_date = now
+                # the payload is not needed anymore once recorded
+                ingestion.observations = []
+        ObservationIngestion.objects.bulk_update(
+            ingestions, ["status", "errors", "completed_date", "observations"]
+        )
+    return len(ingestions)
+
+
+def drain_queue() -> int:
+    """
+    Processes queued payloads in batches until the queue is empty.
+    """
+    processed = 0
+    while consumed := process_queue_batch():
+        processed += consumed
+    return processed
+
+
+def delete_processed_ingestions() -> int:
+    deleted, _ = (
+        ObservationIngestion.objects.exclude(status=ObservationIngestionStatus.queued)
+        .filter(created_date__lt=timezone.now() - INGESTION_RETENTION)
+        .delete()
+    )
+    return deleted
@@ -0,0 +1,96 @@
+"""
+Write-through cache of the latest reading of each vital recorded by the
+vitals observation devices, so that dashboards can be served without
+scanning the observations.
+"""
+
+from collections import defaultdict
+from datetime import datetime
+
+from django.core.cache import cache
+
+from care.emr.models import Observation
+from vitals_observation_device.settings import plugin_settings as settings
+
+
+def latest_vitals_cache_key(device_external_id, encounter_external_id) -> str:
+    return f"latest_vitals:{device_external_id}:{encounter_external_id}"
+
+
+def get_vital_code(observation: Observation) -> str:
+    code = observation.main_code or {}
+    return f"{code.get('system')}|{code.get('code')}"
+
+
+def serialize_vital(observation: Observation) -> dict:
+    return {
+        "code": observation.main_code,
+        "value_type": observation.value_type,
+        "value": observation.value,
+        "interpretation": observation.interpretation,
+        "effective_datetime": observation.effective_datetime.isoformat(),
+    }
+
+
+def update_latest_vitals(device_external_id, observations: list[Observation]):
+    """
+    Merges the newest reading of each code into the latest vitals of the
+    device for the encounters of the readings. Undated readings can not be
+    ordered against the cached ones, and are left out.
+    """
+    observations = [o for o in observations if o.effective_datetime is not None]
+    if device_external_id is None or not observations:
+        return
+
+    newest = {}
+    for observation in observations:
+        key = (observation.encounter.external_id, get_vital_code(observation))
+        current = newest.get(key)
+        if current is None or observation.effective_datetime > (
+            current.effective_datetime
+        ):
+            newest[key] = observation
+
+    by_encounter = {}
+    for (encounter_external_id, code), observation in newest.items():
+        by_encounter.setdefault(
+            latest_vitals_cache_key(device_external_id, encounter_external_id), {}
+        )[code] = observation
+
+    cached = cache.get_many(list(by_encounter))
+    updates = {}
+    for cache_key, readings in by_encounter.items():
+        vitals = cached.get(cache_key, {})
+        for code, observation in readings.items():
+            if code not in vitals or observation.effective_datetime >= (
+                datetime.fromisoformat(vitals[code]["effective_datetime"])
+            ):
+                vitals[code] = serialize_vital(observation)
+        updates[cache_key] = vitals
+    cache.set_many(updates, timeout=settings.CARE_TELEICU_OBSERVATIONS_LATEST_TTL)
+
+
+def update_recorded_latest_vitals(observations: list[Observation]):
+    """
+    Updates the latest vitals with the recorded readings, of the devices they
+    were prepared for.
+    """
+    by_device = defaultdict(list)
+    for observation in observations:
+        if device_external_id := getattr(observation, "_device_external_id", None):
+            by_device[device_external_id].append(observation)
+    for device_external_id, readings in by_device.items():
+        update_latest_vitals(device_external_id, readings)
+
+
+def get_latest_vitals(devices: list[tuple]) -> dict[tuple, list[dict]]:
+    """
+    Returns the latest vitals of the (device, encounter) external id pairs
+    with a single cache lookup.
+    """
+    keys = {latest_vitals_cache_key(*device): device for device in devices}
+    cached = cache.get_many(list(keys))
+    return {
+        device: list(cached.get(cache_key, {}).values())
+        for cache_key, device in keys.items()
+    }
@@ -0,0 +1,74 @@
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ObservationIngestion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("external_id", models.UUIDField(default=uuid.uuid4, unique=True)),
+                ("gateway", models.UUIDField()),
+                ("device", models.UUIDField()),
+                (
+                    "device_type",
+                    models.CharField(blank=True, max_length=255, null=True),
+                ),
+                ("encounter", models.UUIDField()),
+                ("observations", models.JSONField(default=list)),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "Queued"),
+                            ("completed", "Completed"),
+                            ("failed", "Failed"),
+                        ],
+                        default="queued",
+                        max_length=16,
+                    ),
+                ),
+                ("errors", models.JSONField(blank=True, null=True)),
+                (
+                    "created_date",
+                    models.DateTimeField(auto_now_add=True, db_index=True),
+                ),
+                ("completed_date", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["status", "id"],
+                        name="observation_ingestion_queue",
+                    )
+                ],
+            },
+        ),
+    ]
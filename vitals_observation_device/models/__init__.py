@@ -0,0 +1 @@
+from .observation_ingestion import *  # noqa F403
@@ -0,0 +1,41 @@
+import uuid
+
+from django.conf import settings
+from django.db import models
+
+
+class ObservationIngestionStatus(models.TextChoices):
+    queued = "queued"
+    completed = "completed"
+    failed = "failed"
+
+
+class ObservationIngestion(models.Model):
+    """
+    Payload of automated observations queued for the ingestion worker, kept
+    after it is processed as the status of the ingestion.
+    """
+
+    external_id = models.UUIDField(default=uuid.uuid4, unique=True)
+    gateway = models.UUIDField()
+    device = models.UUIDField()
+    device_type = models.CharField(max_length=255, null=True, blank=True)
+    encounter = models.UUIDField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True
+    )
+    observations = models.JSONField(default=list)
+    count = models.IntegerField(default=0)
+    status = models.CharField(
+        max_length=16,
+        choices=ObservationIngestionStatus.choices,
+        default=ObservationIngestionStatus.queued,
+    )
+    errors = models.JSONField(null=True, blank=True)
+    created_date = models.DateTimeField(auto_now_add=True, db_index=True)
+    completed_date = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["status", "id"], name="observation_ingestion_queue")
+        ]
@@ -7,7 +7,7 @@ from django.core.signals import setting_changed
 from django.dispatch import receiver
 from rest_framework.settings import perform_import
 
-from gateway_device.apps import PLUGIN_NAME
+from vitals_observation_device.apps import PLUGIN_NAME
 
 env = environ.Env()
 
@@ -101,6 +101,23 @@ REQUIRED_SETTINGS = {
 }
 
 DEFAULTS = {
+    "CARE_TELEICU_OBSERVATIONS_STREAM_CHUNK_SIZE": 500,
+    "CARE_TELEICU_OBSERVATIONS_FAST_VALIDATION": True,
+    "CARE_TELEICU_OBSERVATIONS_ASYNC_INGESTION": False,
+    "CARE_TELEICU_OBSERVATIONS_ASYNC_COALESCE_WINDOW": 2,
+    "CARE_TELEICU_OBSERVATIONS_ASYNC_MAX_BATCH": 200,
+    "CARE_TELEICU_OBSERVATIONS_DEDUPLICATE": True,
+    "CARE_TELEICU_OBSERVATIONS_RECENT_KEY_TTL": 60 * 60,
+    "CARE_TELEICU_OBSERVATIONS_IDEMPOTENCY_TTL": 60 * 60 * 24,
+    "CARE_TELEICU_OBSERVATIONS_LATEST_TTL": 60 * 60 * 24,
+    # device routes are invalidated by the model signals, which bulk updates
+    # of the devices do not send, so they are only trusted for a short while
+    "CARE_TELEICU_OBSERVATIONS_ROUTE_CACHE_TTL": 30,
+    "CARE_TELEICU_OBSERVATIONS_LONG_POLL_TIMEOUT": 30,
+    "CARE_TELEICU_OBSERVATIONS_LONG_POLL_INTERVAL": 0.5,
+    # downsampling policies by device type and observation code, see
+    # vitals_observation_device.downsampling
+    "CARE_TELEICU_OBSERVATIONS_DOWNSAMPLING": {},
 }
 
 plugin_settings = PluginSettings(
@@ -1,9 +1,38 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.db import transaction
 from django.dispatch import receiver
 from django.utils import timezone
 
 from care.emr.models import FacilityLocation, Device, DeviceEncounterHistory
+from vitals_observation_device.device_cache import (
+    invalidate_device_routes,
+    record_device_change,
+)
+
+
+def get_device_list_state(device) -> tuple:
+    """
+    Fields of the device that are part of the device list of its gateway.
+    """
+    metadata = device.metadata or {}
+    return (
+        metadata.get("gateway"),
+        metadata.get("endpoint_address"),
+        device.current_encounter_id,
+    )
+
+
+def is_listed(state) -> bool:
+    gateway, _, encounter = state
+    return bool(gateway and encounter)
+
+
+def record_device_change_on_commit(*args):
+    """
+    Records the change once the transaction saving the device commits, so
+    that gateways never see a version their device list does not reflect.
+    """
+    transaction.on_commit(lambda: record_device_change(*args))
 
 
 @receiver(post_save, sender=FacilityLocation)
@@ -18,7 +47,10 @@ def unlink_on_encounter_location_changed(sender, instance, created, **kwargs):
     ).exclude(current_encounter=instance.current_encounter)
 
     with transaction.atomic():
+        unlinked = []
         for device in devices_to_unlink:
+            gateway = (device.metadata or {}).get("gateway")
+            unlinked.append((gateway, device.external_id))
             if device.current_encounter:
                 old_obj = DeviceEncounterHistory.objects.filter(
                     device=device, encounter=device.current_encounter, end__isnull=True
@@ -27,3 +59,72 @@ def unlink_on_encounter_location_changed(sender, instance, created, **kwargs):
                     old_obj.end = timezone.now()
                     old_obj.save()
         devices_to_unlink.update(current_encounter=None)
+
+        def on_unlinked():
+            invalidate_device_routes(*[external_id for _, external_id in unlinked])
+            for gateway, external_id in unlinked:
+                record_device_change(gateway, external_id)
+
+        transaction.on_commit(on_unlinked)
+
+
+@receiver(pre_save, sender=Device)
+def remember_device_list_state(sender, instance, **kwargs):
+    if instance.care_type != "vitals-observation" or instance.pk is None:
+        return
+    previous = Device.objects.filter(pk=instance.pk).first()
+    instance._previous_device_list_state = (
+        get_device_list_state(previous) if previous else None
+    )
+
+
+@receiver(post_save, sender=Device)
+def record_device_list_change_on_save(sender, instance, created, **kwargs):
+    """
+    Records the device as removed from the device list of the gateway it was
+    moved from, and as added, updated or removed on its current gateway.
+    """
+    if instance.care_type != "vitals-observation":
+        return
+    previous = getattr(instance, "_previous_device_list_state", None)
+    current = get_device_list_state(instance)
+    if previous == current:
+        return
+    if previous and is_listed(previous) and previous[0] != current[0]:
+        record_device_change_on_commit(previous[0], instance.external_id)
+    if is_listed(current):
+        record_device_change_on_commit(
+            current[0], instance.external_id, current[1] or ""
+        )
+    elif previous and is_listed(previous) and previous[0] == current[0]:
+        record_device_change_on_commit(current[0], instance.external_id)
+
+
+@receiver(post_delete, sender=Device)
+def record_device_list_change_on_delete(sender, instance, **kwargs):
+    if instance.care_type != "vitals-observation":
+        return
+    state = get_device_list_state(instance)
+    if is_listed(state):
+        record_device_change_on_commit(state[0], instance.external_id)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+def invalidate_device_route(sender, instance, **kwargs):
+    """
+    Drops the cached route of the device so that the ingestion picks up the
+    new gateway or encounter on the next request.
+    """
+    if instance.care_type == "vitals-observation":
+        # invalidated once committed, so that a concurrent lookup does not
+        # cache the route from before the change again
+        transaction.on_commit(lambda: invalidate_device_routes(instance.external_id))
+
+
+@receiver(post_save, sender=DeviceEncounterHistory)
+@receiver(post_delete, sender=DeviceEncounterHistory)
+def invalidate_device_route_on_encounter_history(sender, instance, **kwargs):
+    device = instance.device
+    if device.care_type == "vitals-observation":
+        transaction.on_commit(lambda: invalidate_device_routes(device.external_id))
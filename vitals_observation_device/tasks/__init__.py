@@ -0,0 +1,21 @@
+from celery import Celery, current_app
+from celery.schedules import crontab
+
+from vitals_observation_device.tasks.ingest_observations import (
+    cleanup_observation_ingestions,
+    drain_observation_queue,
+)
+
+
+@current_app.on_after_finalize.connect
+def setup_periodic_tasks(sender: Celery, **kwargs):
+    sender.add_periodic_task(
+        crontab(minute="*"),
+        drain_observation_queue.s(),
+        name="drain_observation_queue",
+    )
+    sender.add_periodic_task(
+        crontab(minute="0"),
+        cleanup_observation_ingestions.s(),
+        name="cleanup_observation_ingestions",
+    )
@@ -0,0 +1,37 @@
+from logging import Logger
+
+from celery import shared_task
+from celery.utils.log import get_task_logger
+from django.db import DatabaseError
+
+from vitals_observation_device.ingestion_queue import (
+    delete_processed_ingestions,
+    drain_queue,
+)
+
+logger: Logger = get_task_logger(__name__)
+
+
+@shared_task(bind=True, max_retries=5)
+def drain_observation_queue(self):
+    """
+    Records the automated observations queued by the gateways, coalescing the
+    queued payloads into batched inserts.
+    """
+    try:
+        processed = drain_queue()
+    except DatabaseError as e:
+        logger.warning("Failed to record queued observations, retrying: %s", e)
+        raise self.retry(exc=e, countdown=5 * (self.request.retries + 1)) from e
+    if processed:
+        logger.info("Recorded %s queued observation payloads", processed)
+
+
+@shared_task
+def cleanup_observation_ingestions():
+    """
+    Deletes the processed observation ingestions that are past the retention
+    for their status.
+    """
+    deleted = delete_processed_ingestions()
+    logger.info("Deleted %s processed observation ingestions", deleted)
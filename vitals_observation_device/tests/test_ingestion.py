@@ -0,0 +1,136 @@
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from model_bakery import baker
+
+from care.emr.models import Encounter, Observation
+from care.users.models import User
+from vitals_observation_device.apps import PLUGIN_NAME
+from vitals_observation_device.downsampling import (
+    downsample_observations,
+    warn_invalid_policy,
+)
+from vitals_observation_device.ingestion import (
+    build_observation,
+    build_observations_batch,
+)
+
+
+def observation_payload(count):
+    now = timezone.now()
+    return [
+        {
+            "status": "final",
+            "category": {
+                "system": "http://terminology.hl7.org/CodeSystem/observation-category",
+                "code": "vital-signs",
+                "display": "Vital Signs",
+            },
+            "main_code": {
+                "system": "http://loinc.org",
+                "code": code,
+                "display": display,
+            },
+            "value_type": "decimal",
+            "value": {"value": str(60 + i)},
+            "effective_datetime": (now + timedelta(seconds=i)).isoformat(),
+        }
+        for i, (code, display) in enumerate(
+            [
+                ("8867-4", "Heart rate"),
+                ("9279-1", "Respiratory rate"),
+                ("8310-5", "Body temperature"),
+            ][:count]
+        )
+    ]
+
+
+def row(observation: Observation) -> dict:
+    # external ids are random per reading, everything else has to match
+    return {
+        field.attname: getattr(observation, field.attname)
+        for field in Observation._meta.concrete_fields
+        if field.attname not in ("id", "external_id")
+    }
+
+
+class BuildObservationsBatchTest(TestCase):
+    def setUp(self):
+        self.encounter = baker.make(Encounter)
+        self.user = baker.make(User)
+
+    def test_batch_builds_the_same_rows_as_per_item(self):
+        payload = observation_payload(3)
+
+        per_item = [
+            build_observation(self.encounter, observation, self.user)
+            for observation in payload
+        ]
+        batch = build_observations_batch(self.encounter, payload, self.user)
+
+        self.assertEqual([row(o) for o in batch], [row(o) for o in per_item])
+
+    def test_batch_rejects_fields_set_for_the_encounter(self):
+        payload = observation_payload(1)
+        payload[0]["encounter"] = str(baker.make(Encounter).external_id)
+
+        with self.assertRaises(TypeError):
+            build_observation(self.encounter, payload[0], self.user)
+        with self.assertRaises(TypeError):
+            build_observations_batch(self.encounter, payload, self.user)
+
+
+@override_settings(
+    PLUGIN_CONFIGS={
+        PLUGIN_NAME: {
+            "CARE_TELEICU_OBSERVATIONS_DOWNSAMPLING": {
+                "HL7-Monitor": {"*": {"mode": "sample", "window": 60}}
+            }
+        }
+    }
+)
+class DownsampleObservationsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        warn_invalid_policy.cache_clear()
+        self.encounter = baker.make(Encounter)
+        self.user = baker.make(User)
+
+    def build(self, count):
+        payload = observation_payload(1) * count
+        return build_observations_batch(self.encounter, payload, self.user)
+
+    def test_keeps_one_reading_per_window(self):
+        kept = downsample_observations("device", "HL7-Monitor", self.build(3))
+
+        self.assertEqual(len(kept), 1)
+
+    def test_passes_undated_readings_through(self):
+        observations = self.build(3)
+        for observation in observations:
+            observation.effective_datetime = None
+
+        kept = downsample_observations("device", "HL7-Monitor", observations)
+
+        self.assertEqual(kept, observations)
+
+    def test_ignores_unknown_modes(self):
+        with override_settings(
+            PLUGIN_CONFIGS={
+                PLUGIN_NAME: {
+                    "CARE_TELEICU_OBSERVATIONS_DOWNSAMPLING": {
+                        "HL7-Monitor": {"*": {"mode": "aggregate", "window": 60}}
+                    }
+                }
+            }
+        ):
+            with self.assertLogs(
+                "vitals_observation_device.downsampling", "WARNING"
+            ):
+                kept = downsample_observations(
+                    "device", "HL7-Monitor", self.build(3)
+                )
+
+        self.assertEqual(len(kept), 3)
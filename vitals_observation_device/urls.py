@@ -4,6 +4,8 @@ from rest_framework.routers import DefaultRouter, SimpleRouter
 from vitals_observation_device.viewsets.automated_observations import (
     AutomatedObservationsViewSet,
 )
+from vitals_observation_device.viewsets.device_changes import get_device_changes_urls
+from vitals_observation_device.viewsets.vitals_snapshot import VitalsSnapshotViewSet
 
 router = DefaultRouter() if settings.DEBUG else SimpleRouter()
 
@@ -12,5 +14,10 @@ router.register(
     AutomatedObservationsViewSet,
     basename="automated-observations",
 )
+router.register(
+    "vitals_snapshot",
+    VitalsSnapshotViewSet,
+    basename="vitals-snapshot",
+)
 
-urlpatterns = router.urls
+urlpatterns = get_device_changes_urls() + router.urls
@@ -1,15 +1,62 @@
-import uuid
-
-from drf_spectacular.utils import extend_schema
-from pydantic import BaseModel, RootModel
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from pydantic import UUID4, BaseModel, RootModel
+from pydantic import ValidationError as PydanticValidationError
+from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import APIException, NotFound, ValidationError
 from rest_framework.response import Response
 from rest_framework.viewsets import GenericViewSet
 
-from care.emr.models import Device, Observation
+from care.emr.models import Device
 from care.emr.resources.observation.spec import ObservationSpec
-from care.emr.resources.questionnaire.spec import SubjectType
 from vitals_observation_device.authentication import AutomatedObservationsAuthentication
+from vitals_observation_device.device_cache import (
+    get_device_routes,
+    get_gateway_devices_etag,
+    get_route_device,
+    get_route_encounter,
+)
+from vitals_observation_device.ingestion import (
+    build_observations,
+    ingest_ndjson_stream,
+    insert_observations,
+    prepare_observations,
+)
+from vitals_observation_device.ingestion_queue import (
+    enqueue_observations,
+    get_ingestion_status,
+    get_queue_stats,
+)
+from vitals_observation_device.settings import plugin_settings as settings
+
+NDJSON_CONTENT_TYPE = "application/x-ndjson"
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+IDEMPOTENCY_KEY_PARAMETER = OpenApiParameter(
+    IDEMPOTENCY_KEY_HEADER,
+    str,
+    OpenApiParameter.HEADER,
+    description="Retries of a request with the same key are answered with the "
+    "response of the first request instead of being recorded again.",
+)
+
+
+# how long a request holds its idempotency key before its response is stored,
+# should the worker handling it die
+IDEMPOTENCY_PENDING_TIMEOUT = 60
+
+
+class IdempotencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with the same Idempotency-Key is in progress"
+    default_code = "idempotency_conflict"
+
+
+def idempotency_cache_key(gateway_id, scope: str, key: str) -> str:
+    return f"observation_idempotency:{gateway_id}:{scope}:{key}"
 
 
 class DeviceListSpec(BaseModel):
@@ -25,6 +72,43 @@ class RecordRequest(RootModel[list[ObservationSpec]]):
     pass
 
 
+class RecordEnvelope(RootModel[list[dict]]):
+    pass
+
+
+class RecordQueuedResponse(BaseModel):
+    message: str
+    ingestion_id: str
+
+
+class RecordStreamResponse(BaseModel):
+    message: str
+    accepted: int
+    created: int
+    rejected: int
+    errors: list[dict]
+
+
+class RecordBatchItem(BaseModel):
+    device: UUID4
+    observations: list[dict]
+
+
+class RecordBatchRequest(RootModel[list[RecordBatchItem]]):
+    pass
+
+
+class RecordBatchResult(BaseModel):
+    device: str
+    status: str
+    count: int = 0
+    errors: list | str | None = None
+
+
+class RecordBatchResponse(RootModel[list[RecordBatchResult]]):
+    pass
+
+
 class AutomatedObservationsViewSet(GenericViewSet):
     queryset = Device.objects.filter(
         care_type="vitals-observation", current_encounter__isnull=False
@@ -39,55 +123,267 @@ class AutomatedObservationsViewSet(GenericViewSet):
             .filter(metadata__gateway=str(self.request.gateway.external_id))
         )
 
+    def get_idempotency_cache_key(self, scope: str) -> str | None:
+        key = self.request.headers.get(IDEMPOTENCY_KEY_HEADER)
+        if not key:
+            return None
+        return idempotency_cache_key(self.request.gateway.external_id, scope, key)
+
+    def idempotent(self, scope: str, handler) -> Response:
+        """
+        Returns the stored response of an earlier request with the same
+        idempotency key, or calls the handler and stores its response.
+        """
+        cache_key = self.get_idempotency_cache_key(scope)
+        if cache_key is None:
+            return handler()
+        # the key is claimed before handling the request, so that concurrent
+        # retries do not both get recorded
+        if not cache.add(cache_key, {"status": None}, IDEMPOTENCY_PENDING_TIMEOUT):
+            stored = cache.get(cache_key)
+            if stored is None or stored["status"] is None:
+                raise IdempotencyConflict
+            return Response(stored["data"], status=stored["status"])
+        try:
+            response = handler()
+        except BaseException:
+            cache.delete(cache_key)
+            raise
+        if response.status_code < status.HTTP_400_BAD_REQUEST:
+            cache.set(
+                cache_key,
+                {"data": response.data, "status": response.status_code},
+                timeout=settings.CARE_TELEICU_OBSERVATIONS_IDEMPOTENCY_TTL,
+            )
+        else:
+            cache.delete(cache_key)
+        return response
+
+    def get_routes(self, device_external_ids) -> dict[str, dict]:
+        """
+        Routes of the devices that belong to the requesting gateway and are
+        linked to an encounter.
+        """
+        gateway = str(self.request.gateway.external_id)
+        return {
+            external_id: route
+            for external_id, route in get_device_routes(device_external_ids).items()
+            if route["gateway"] == gateway and route["encounter_pk"] is not None
+        }
+
+    def get_routed_device(self):
+        """
+        Counterpart of `get_object` for the ingestion, served from the device
+        routing cache without any queries.
+        """
+        routes = self.get_routes([self.kwargs[self.lookup_field]])
+        if not routes:
+            raise NotFound("No Device matches the given query.")
+        route = next(iter(routes.values()))
+        return get_route_device(route), get_route_encounter(route)
+
+    def get_device_list(self) -> list[dict]:
+        queryset = self.filter_queryset(self.get_queryset()).values_list(
+            "external_id", "metadata__endpoint_address"
+        )
+        return [
+            {"id": str(external_id), "endpoint_address": endpoint_address}
+            for external_id, endpoint_address in queryset
+        ]
+
     @extend_schema(
-        description="Lists vitals observation devices of the gateway that can be used for yielding automated observations.",
+        description="Lists vitals observation devices of the gateway that can be used for yielding automated observations. "
+        "Responses carry an ETag, requests with a matching `If-None-Match` "
+        "are answered with 304.",
         responses={
             200: DeviceListResponse,
+            304: None,
         },
     )
     def list(self, request, *args, **kwargs):
-        queryset = self.filter_queryset(self.get_queryset())
-        return Response(
-            [
-                DeviceListSpec(
-                    id=str(d.external_id),
-                    endpoint_address=d.metadata["endpoint_address"],
-                ).model_dump(mode="json")
-                for d in queryset
-            ]
-        )
+        etag = get_gateway_devices_etag(request.gateway.external_id)
+        if etag in parse_etags(request.headers.get("If-None-Match", "")):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+
+        return Response(self.get_device_list(), headers={"ETag": etag})
 
     @extend_schema(
-        description="Callback for Gateway Device to post observations.",
-        request=RecordRequest,
+        description="Callback for Gateway Device to post observations. "
+        f"Large payloads can be posted as `{NDJSON_CONTENT_TYPE}` with one "
+        "observation per line, which are validated and recorded in chunks and "
+        "reported as accepted / created / rejected counts. When asynchronous "
+        "ingestion is enabled, JSON payloads are queued and acknowledged with "
+        "202 and an ingestion id instead. Observations already recorded for the "
+        "device with the same code and effective datetime are skipped, and "
+        "high frequency readings are downsampled as configured for the device "
+        "type.",
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+        request={
+            "application/json": RecordRequest,
+            NDJSON_CONTENT_TYPE: {"type": "string"},
+        },
         responses={
             200: {"type": "object", "example": {"message": "ok"}},
+            202: RecordQueuedResponse,
             400: {"type": "object", "properties": {"error": {"type": "string"}}},
         },
     )
     @action(detail=True, methods=["post"])
     def record(self, request, *args, **kwargs):
-        encounter = self.get_object().current_encounter
-        if encounter is None:
-            raise ValueError("No encounter associated with the device")
-        observations_objects = [
-            ObservationSpec(
-                **observation,
-                subject_type=SubjectType.encounter,
-                encounter=encounter.external_id,
-                data_entered_by_id=request.user.id,
-                created_by_id=request.user.id,
-                updated_by_id=request.user.id,
+        device, encounter = self.get_routed_device()
+        return self.idempotent(
+            f"record:{device.external_id}",
+            lambda: self._record(request, device, encounter),
+        )
+
+    def _record(self, request, device, encounter):
+        if request.content_type.startswith(NDJSON_CONTENT_TYPE):
+            result = ingest_ndjson_stream(
+                encounter,
+                # read the underlying django request line by line, DRF's
+                # request.stream is unavailable without a content length
+                request._request,
+                request.user,
+                settings.CARE_TELEICU_OBSERVATIONS_STREAM_CHUNK_SIZE,
+                device=device,
             )
-            for observation in request.data
-        ]
-        bulk = []
-        for observation in observations_objects:
-            temp = observation.de_serialize()
-            temp.patient = encounter.patient
-            temp.encounter = encounter
-            temp.subject_id = encounter.external_id
-            temp.external_id = uuid.uuid4()
-            bulk.append(temp)
-        Observation.objects.bulk_create(bulk)
+            return Response(
+                RecordStreamResponse(message="ok", **result).model_dump(mode="json")
+            )
+
+        if settings.CARE_TELEICU_OBSERVATIONS_ASYNC_INGESTION:
+            observations = RecordEnvelope.model_validate(request.data).root
+            ingestion_id = enqueue_observations(
+                request.gateway, device, encounter, request.user, observations
+            )
+            return Response(
+                RecordQueuedResponse(
+                    message="queued", ingestion_id=ingestion_id
+                ).model_dump(mode="json"),
+                status=status.HTTP_202_ACCEPTED,
+            )
+
+        observations = build_observations(encounter, request.data, request.user)
+        insert_observations(
+            prepare_observations(
+                device.external_id, device.metadata.get("type"), observations
+            )
+        )
         return Response({"message": "ok"})
+
+    @extend_schema(
+        description="Status of an asynchronous observation ingestion.",
+        responses={200: {"type": "object"}},
+    )
+    @action(
+        detail=False,
+        methods=["get"],
+        url_path=r"ingestions/(?P<ingestion_id>[^/.]+)",
+    )
+    def ingestion_status(self, request, ingestion_id=None, *args, **kwargs):
+        ingestion = get_ingestion_status(ingestion_id)
+        if ingestion is None or ingestion["gateway"] != str(
+            request.gateway.external_id
+        ):
+            raise NotFound("Ingestion not found")
+        return Response(ingestion)
+
+    @extend_schema(
+        description="Depth of the asynchronous observation ingestion queue.",
+        responses={200: {"type": "object"}},
+    )
+    @action(detail=False, methods=["get"])
+    def ingestion_queue(self, request, *args, **kwargs):
+        return Response(get_queue_stats())
+
+    @extend_schema(
+        description="Callback for Gateway Device to post observations of multiple "
+        "devices at once. Results are reported per device, observations of "
+        "devices that could not be recorded do not fail the rest of the batch.",
+        parameters=[IDEMPOTENCY_KEY_PARAMETER],
+        request=RecordBatchRequest,
+        responses={200: RecordBatchResponse},
+    )
+    @action(detail=False, methods=["post"])
+    def record_batch(self, request, *args, **kwargs):
+        return self.idempotent("record_batch", lambda: self._record_batch(request))
+
+    def _record_batch(self, request):
+        try:
+            entries = RecordEnvelope.model_validate(request.data).root
+        except PydanticValidationError as e:
+            raise ValidationError(
+                e.errors(include_url=False, include_context=False)
+            ) from e
+        # items are validated one at a time, so that a malformed item is
+        # reported against its device instead of failing the whole batch
+        items = []
+        for entry in entries:
+            try:
+                items.append(RecordBatchItem.model_validate(entry))
+            except PydanticValidationError as e:
+                items.append(
+                    RecordBatchResult(
+                        device=str(entry.get("device", "")),
+                        status="error",
+                        errors=e.errors(include_url=False, include_context=False),
+                    )
+                )
+        routes = self.get_routes(
+            {item.device for item in items if isinstance(item, RecordBatchItem)}
+        )
+
+        results = []
+        recorded = []
+        bulk = []
+        for item in items:
+            if isinstance(item, RecordBatchResult):
+                results.append(item)
+                continue
+            device_id = str(item.device)
+            route = routes.get(device_id)
+            if route is None:
+                results.append(
+                    RecordBatchResult(
+                        device=device_id,
+                        status="error",
+                        errors="Device not found or not linked to an encounter",
+                    )
+                )
+                continue
+            try:
+                observations = build_observations(
+                    get_route_encounter(route), item.observations, request.user
+                )
+            except PydanticValidationError as e:
+                results.append(
+                    RecordBatchResult(
+                        device=device_id,
+                        status="error",
+                        errors=e.errors(include_url=False, include_context=False),
+                    )
+                )
+                continue
+            except (TypeError, ValueError) as e:
+                results.append(
+                    RecordBatchResult(device=device_id, status="error", errors=str(e))
+                )
+                continue
+            observations = prepare_observations(
+                device_id, route["device_type"], observations
+            )
+            bulk.extend(observations)
+            result = RecordBatchResult(device=device_id, status="ok")
+            results.append(result)
+            recorded.append((result, observations))
+
+        with transaction.atomic():
+            created = {id(observation) for observation in insert_observations(bulk)}
+        for result, observations in recorded:
+            # readings left out as duplicates are not counted
+            result.count = sum(
+                id(observation) in created for observation in observations
+            )
+        return Response(
+            RecordBatchResponse(results).model_dump(mode="json", exclude_none=True)
+        )
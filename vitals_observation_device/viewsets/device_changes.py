@@ -0,0 +1,173 @@
+import asyncio
+import weakref
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.urls import path
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import ValidationError
+
+from vitals_observation_device.device_cache import (
+    gateway_devices_version_cache_key,
+    get_device_changes,
+    get_gateway_devices_version,
+)
+from vitals_observation_device.settings import plugin_settings as settings
+from vitals_observation_device.viewsets.automated_observations import (
+    AutomatedObservationsViewSet,
+)
+
+
+class GatewayDeviceChangeWatcher:
+    """
+    Wakes the long-poll requests waiting for changes to the device lists of
+    their gateways.
+
+    A single poller checks the versions of all watched gateways in the cache,
+    so waiting requests cost neither queries nor cache lookups of their own.
+    """
+
+    def __init__(self):
+        self.waiters: dict[str, set[tuple[int, asyncio.Future]]] = {}
+        self.task: asyncio.Task | None = None
+
+    async def wait(self, gateway_external_id: str, since: int, timeout: float):
+        """
+        Waits until the version of the device list of the gateway is past
+        `since` and returns it, or returns None if the timeout elapses first.
+        """
+        waiter = (since, asyncio.get_running_loop().create_future())
+        waiters = self.waiters.setdefault(gateway_external_id, set())
+        waiters.add(waiter)
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.poll())
+        try:
+            return await asyncio.wait_for(waiter[1], timeout)
+        except asyncio.TimeoutError:
+            # only an alias of TimeoutError from python 3.11 onwards
+            return None
+        finally:
+            waiters.discard(waiter)
+            if not waiters:
+                self.waiters.pop(gateway_external_id, None)
+
+    async def poll(self):
+        interval = settings.CARE_TELEICU_OBSERVATIONS_LONG_POLL_INTERVAL
+        while self.waiters:
+            keys = {
+                gateway_devices_version_cache_key(gateway): gateway
+                for gateway in self.waiters
+            }
+            versions = await cache.aget_many(list(keys))
+            for cache_key, version in versions.items():
+                for since, future in list(self.waiters.get(keys[cache_key], ())):
+                    if version > since and not future.done():
+                        future.set_result(version)
+            await asyncio.sleep(interval)
+
+
+# the watcher's futures and poller task are bound to the event loop they were
+# created in, hence a watcher per event loop.
+_loop_watchers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, GatewayDeviceChangeWatcher]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def get_change_watcher() -> GatewayDeviceChangeWatcher:
+    loop = asyncio.get_running_loop()
+    watcher = _loop_watchers.get(loop)
+    if watcher is None:
+        watcher = _loop_watchers[loop] = GatewayDeviceChangeWatcher()
+    return watcher
+
+
+def _render_exception(viewset, exc):
+    response = viewset.handle_exception(exc)
+    response = viewset.finalize_response(viewset.request, response)
+    return response.render()
+
+
+class DeviceChangesView(View):
+    """
+    Long-poll feed of the changes to the device list of the requesting
+    gateway.
+
+    `?since=<version>` blocks until the device list changes after the version
+    or `?timeout=<seconds>` elapses, and returns the changes as
+
+        {"version": 12, "changes": [{"version": 12, "id": "...", "removed": true}]}
+
+    Without `since`, or when the changes since the version are no longer
+    available, the full device list is returned with `"reset": true`.
+    """
+
+    http_method_names = ["get"]
+
+    def get_viewset(self, request):
+        viewset = AutomatedObservationsViewSet(
+            action_map={"get": "list"}, args=(), kwargs={}, format_kwarg=None
+        )
+        viewset.request = viewset.initialize_request(request)
+        viewset.headers = viewset.default_response_headers
+        return viewset
+
+    def get_params(self, request) -> tuple[int | None, float]:
+        max_timeout = settings.CARE_TELEICU_OBSERVATIONS_LONG_POLL_TIMEOUT
+        try:
+            since = request.GET.get("since")
+            since = int(since) if since else None
+            timeout = float(request.GET.get("timeout", max_timeout))
+        except ValueError as e:
+            raise ValidationError("since and timeout must be numbers") from e
+        return since, min(max(timeout, 0), max_timeout)
+
+    def prepare(self, viewset):
+        try:
+            viewset.initial(viewset.request)
+            since, timeout = self.get_params(viewset.request)
+            gateway_external_id = str(viewset.request.gateway.external_id)
+            version = get_gateway_devices_version(gateway_external_id)
+            return (gateway_external_id, since, timeout, version), None
+        except Exception as exc:
+            return None, _render_exception(viewset, exc)
+
+    def get_response(self, viewset, gateway_external_id, since, version):
+        changes = None
+        if since is not None and since <= version:
+            changes = get_device_changes(gateway_external_id, since, version)
+        if changes is None:
+            return {
+                "version": version,
+                "reset": True,
+                "devices": viewset.get_device_list(),
+            }
+        return {"version": version, "changes": changes}
+
+    async def get(self, request, *args, **kwargs):
+        viewset = self.get_viewset(request)
+        prepared, error_response = await sync_to_async(self.prepare)(viewset)
+        if error_response is not None:
+            return error_response
+        gateway_external_id, since, timeout, version = prepared
+
+        if since == version and timeout:
+            version = (
+                await get_change_watcher().wait(gateway_external_id, since, timeout)
+                or since
+            )
+        response = await sync_to_async(self.get_response)(
+            viewset, gateway_external_id, since, version
+        )
+        return JsonResponse(response, json_dumps_params={"separators": (",", ":")})
+
+
+def get_device_changes_urls(prefix: str = "automated_observations/changes"):
+    return [
+        path(
+            f"{prefix}/",
+            csrf_exempt(DeviceChangesView.as_view()),
+            name="automated-observations-changes",
+        )
+    ]
@@ -0,0 +1,79 @@
+from drf_spectacular.utils import OpenApiParameter, extend_schema
+from pydantic import BaseModel, RootModel
+from rest_framework.exceptions import PermissionDenied, ValidationError
+from rest_framework.generics import get_object_or_404
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet
+
+from care.emr.models import Device
+from care.facility.models import Facility
+from care.security.authorization import AuthorizationController
+from vitals_observation_device.latest_vitals import get_latest_vitals
+
+
+class VitalsSnapshotSpec(BaseModel):
+    device: str
+    encounter: str
+    location: str | None = None
+    vitals: list[dict]
+
+
+class VitalsSnapshotResponse(RootModel[list[VitalsSnapshotSpec]]):
+    pass
+
+
+class VitalsSnapshotViewSet(GenericViewSet):
+    queryset = Device.objects.filter(
+        care_type="vitals-observation", current_encounter__isnull=False
+    )
+
+    def get_queryset(self):
+        facility_external_id = self.request.GET.get("facility")
+        if not facility_external_id:
+            raise ValidationError({"facility": "This query parameter is required"})
+        facility = get_object_or_404(Facility, external_id=facility_external_id)
+        if not AuthorizationController.call(
+            "can_list_devices", self.request.user, facility
+        ):
+            raise PermissionDenied(
+                "You do not have permission to list devices of this facility."
+            )
+
+        queryset = super().get_queryset().filter(facility=facility)
+        if locations := self.request.GET.getlist("location"):
+            queryset = queryset.filter(current_location__external_id__in=locations)
+        return queryset
+
+    @extend_schema(
+        description="Latest value of each vital recorded by the vitals "
+        "observation devices of the facility, optionally limited to the given "
+        "locations. Served from the latest vitals cache.",
+        parameters=[
+            OpenApiParameter("facility", str, required=True),
+            OpenApiParameter("location", str, many=True),
+        ],
+        responses={200: VitalsSnapshotResponse},
+    )
+    def list(self, request, *args, **kwargs):
+        devices = self.get_queryset().values_list(
+            "external_id",
+            "current_encounter__external_id",
+            "current_location__external_id",
+        )
+        locations = {
+            (device, encounter): location for device, encounter, location in devices
+        }
+        latest = get_latest_vitals(list(locations))
+        return Response(
+            VitalsSnapshotResponse(
+                [
+                    VitalsSnapshotSpec(
+                        device=str(device),
+                        encounter=str(encounter),
+                        location=str(location) if location else None,
+                        vitals=latest[(device, encounter)],
+                    )
+                    for (device, encounter), location in locations.items()
+                ]
+            ).model_dump(mode="json")
+        )